@@ -0,0 +1,131 @@
+"""Database round trips for user lookups at high concurrency, with and without BatchLoader.
+
+Fires --concurrency simultaneous "requests", each looking up one user the way
+create_score/get_user/... do, for several waves. Lookups hit a simulated users
+repository with --latency per round trip and at most --pool-size round trips
+in flight, like Motor's connection pool (or a real SQLite file with
+--sqlite). Every call to it is counted.
+
+    python bench_loader.py --concurrency 1000 --users 200 --missing 0.05
+"""
+import argparse
+import asyncio
+import random
+import tempfile
+import time
+import uuid
+from datetime import datetime
+from pathlib import Path
+
+from loader import BatchLoader, _request_cache
+
+
+class CountingUsers:
+    """Wraps a users repository and counts database round trips."""
+
+    def __init__(self, repository):
+        self.repository = repository
+        self.round_trips = 0
+        self.documents = 0
+
+    async def get_by_id(self, user_id):
+        self.round_trips += 1
+        document = await self.repository.get_by_id(user_id)
+        self.documents += document is not None
+        return document
+
+    async def get_many_by_id(self, user_ids):
+        self.round_trips += 1
+        documents = await self.repository.get_many_by_id(user_ids)
+        self.documents += len(documents)
+        return documents
+
+
+class SimulatedUsers:
+    def __init__(self, users, latency: float, pool_size: int):
+        self.users = {user["id"]: user for user in users}
+        self.latency = latency
+        self.pool = asyncio.Semaphore(pool_size)
+
+    async def get_by_id(self, user_id):
+        async with self.pool:
+            await asyncio.sleep(self.latency)
+        return self.users.get(user_id)
+
+    async def get_many_by_id(self, user_ids):
+        async with self.pool:
+            await asyncio.sleep(self.latency)
+        return [self.users[user_id] for user_id in user_ids if user_id in self.users]
+
+
+async def request(lookup, user_id):
+    # Each simulated request gets its own loader scope, like LoaderScopeMiddleware
+    token = _request_cache.set({})
+    try:
+        return await lookup(user_id)
+    finally:
+        _request_cache.reset(token)
+
+
+async def run_waves(lookup, keys, args):
+    start = time.perf_counter()
+    for _ in range(args.waves):
+        wave = [random.choice(keys) for _ in range(args.concurrency)]
+        await asyncio.gather(*(request(lookup, key) for key in wave))
+    return time.perf_counter() - start
+
+
+async def main_async(args):
+    users = [
+        {"id": str(uuid.uuid4()), "username": f"user_{i}", "password_hash": "x", "created_at": datetime.utcnow(),
+         "high_score": 0, "total_coins": 0, "levels_completed": 0}
+        for i in range(args.users)
+    ]
+    missing = [str(uuid.uuid4()) for _ in range(max(1, int(args.users * args.missing)))] if args.missing else []
+    keys = [user["id"] for user in users] + missing
+
+    with tempfile.TemporaryDirectory() as tmp:
+        if args.sqlite:
+            from storage_sqlite import SQLiteStorage
+
+            storage = SQLiteStorage(Path(tmp) / "bench.db")
+            for user in users:
+                await storage.users.insert(user)
+            repository = storage.users
+        else:
+            storage = None
+            repository = SimulatedUsers(users, args.latency, args.pool_size)
+
+        direct = CountingUsers(repository)
+        direct_elapsed = await run_waves(direct.get_by_id, keys, args)
+
+        batched = CountingUsers(repository)
+        loader = BatchLoader(batched.get_many_by_id, negative_ttl=args.negative_ttl)
+        batched_elapsed = await run_waves(loader.load, keys, args)
+
+        if storage is not None:
+            await storage.close()
+
+    lookups = args.concurrency * args.waves
+    print(f"{lookups} lookups ({args.waves} waves x {args.concurrency} concurrent) over {len(keys)} keys, {len(missing)} missing")
+    print(f"{'':<12}{'round trips':>12}{'docs read':>12}{'elapsed ms':>12}")
+    print(f"{'find_one':<12}{direct.round_trips:>12}{direct.documents:>12}{direct_elapsed * 1000:>12.1f}")
+    print(f"{'loader':<12}{batched.round_trips:>12}{batched.documents:>12}{batched_elapsed * 1000:>12.1f}")
+    print(f"round trips reduced {direct.round_trips / max(1, batched.round_trips):.0f}x")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark batched user lookups")
+    parser.add_argument('--concurrency', type=int, default=1000)
+    parser.add_argument('--waves', type=int, default=5)
+    parser.add_argument('--users', type=int, default=200)
+    parser.add_argument('--missing', type=float, default=0.05, help="unknown ids to mix in, as a fraction of --users")
+    parser.add_argument('--latency', type=float, default=0.001, help="simulated round-trip latency (s)")
+    parser.add_argument('--pool-size', type=int, default=100, help="simulated connection pool size")
+    parser.add_argument('--negative-ttl', type=float, default=1.0)
+    parser.add_argument('--sqlite', action='store_true', help="query a real SQLite database instead")
+    asyncio.run(main_async(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
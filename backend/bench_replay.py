@@ -0,0 +1,84 @@
+"""Storage benchmark for ghost replays: binary run-length format vs JSON.
+
+Generates synthetic input streams that mimic real play (long stretches of
+running right, short jumps, occasional backtracking) and reports bytes per
+minute of gameplay for each representation.
+
+    python bench_replay.py --minutes 5 --runs 20
+"""
+import argparse
+import gzip
+import json
+import random
+import time
+
+from replay import KEY_BITS, decode_replay, encode_replay, frames_to_runs, runs_to_frames
+
+
+LEFT = KEY_BITS["ArrowLeft"]
+RIGHT = KEY_BITS["ArrowRight"]
+JUMP = KEY_BITS["Space"]
+RUN = KEY_BITS["ShiftLeft"]
+
+
+def simulate_frames(minutes: float, frame_rate: int, rng: random.Random):
+    frames = []
+    total = int(minutes * 60 * frame_rate)
+    while len(frames) < total:
+        action = rng.random()
+        if action < 0.55:
+            mask = RIGHT | (RUN if rng.random() < 0.4 else 0)
+            length = rng.randint(20, 180)
+        elif action < 0.75:
+            mask = RIGHT | JUMP
+            length = rng.randint(8, 25)
+        elif action < 0.85:
+            mask = LEFT
+            length = rng.randint(10, 60)
+        else:
+            mask = 0
+            length = rng.randint(5, 90)
+        frames.extend([mask] * length)
+    return frames[:total]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare replay storage formats")
+    parser.add_argument('--minutes', type=float, default=5.0)
+    parser.add_argument('--runs', type=int, default=20)
+    parser.add_argument('--frame-rate', type=int, default=60)
+    parser.add_argument('--seed', type=int, default=1)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    totals = {"json frames": 0, "json runs": 0, "json frames (gzip)": 0, "binary rle": 0}
+    encode_time = decode_time = 0.0
+
+    for _ in range(args.runs):
+        frames = simulate_frames(args.minutes, args.frame_rate, rng)
+        runs = frames_to_runs(frames)
+        frames_json = json.dumps({"frame_rate": args.frame_rate, "frames": frames}).encode()
+
+        start = time.perf_counter()
+        data = encode_replay(runs, args.frame_rate)
+        encode_time += time.perf_counter() - start
+        start = time.perf_counter()
+        decoded = decode_replay(data)
+        decode_time += time.perf_counter() - start
+        assert runs_to_frames(decoded["runs"]) == frames
+
+        totals["json frames"] += len(frames_json)
+        totals["json runs"] += len(json.dumps({"frame_rate": args.frame_rate, "runs": runs}).encode())
+        totals["json frames (gzip)"] += len(gzip.compress(frames_json))
+        totals["binary rle"] += len(data)
+
+    gameplay_minutes = args.minutes * args.runs
+    baseline = totals["json frames"]
+    print(f"{args.runs} runs x {args.minutes} min at {args.frame_rate} fps")
+    for name, size in totals.items():
+        print(f"{name:<20} {size / gameplay_minutes:>10,.0f} bytes/min  ({baseline / size:6.1f}x smaller than JSON)")
+    print(f"encode: {encode_time / args.runs * 1000:.2f} ms/run, decode: {decode_time / args.runs * 1000:.2f} ms/run")
+
+
+if __name__ == "__main__":
+    main()
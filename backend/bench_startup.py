@@ -0,0 +1,123 @@
+"""Import-time and cold-start benchmark for the backend, checked against a budget.
+
+Measures, each in a fresh interpreter:
+
+* the cumulative ``python -X importtime`` cost of ``import server``
+* time from spawning uvicorn to the first successful ``/api/health`` response
+
+and exits non-zero if the median of either exceeds its budget, so it can run
+in CI next to the other checks:
+
+    python bench_startup.py --repeat 5
+"""
+import argparse
+import os
+import re
+import socket
+import statistics
+import subprocess
+import sys
+import time
+from pathlib import Path
+
+import requests
+
+
+BACKEND_DIR = Path(__file__).parent
+IMPORT_BUDGET_MS = 500
+FIRST_REQUEST_BUDGET_MS = 2500
+
+_IMPORTTIME_LINE = re.compile(r"import time:\s+(\d+) \|\s+(\d+) \|(\s*)(\S+)")
+
+
+def measure_import(env: dict):
+    """Return (total ms for ``import server``, slowest top-level imports)."""
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", "import server"],
+        cwd=BACKEND_DIR, env=env, capture_output=True, text=True, check=True
+    )
+    total = None
+    top_level = []
+    for line in result.stderr.splitlines():
+        match = _IMPORTTIME_LINE.match(line)
+        if not match:
+            continue
+        cumulative_us, indent, module = int(match.group(2)), match.group(3), match.group(4)
+        if module == "server":
+            total = cumulative_us / 1000
+        elif len(indent) == 1:
+            # Finished an unrelated top-level import (interpreter startup);
+            # children are printed before their parent.
+            top_level = []
+        elif len(indent) == 3:
+            top_level.append((cumulative_us / 1000, module))
+    return total, sorted(top_level, reverse=True)[:8]
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def measure_first_request(env: dict, timeout: float = 30.0) -> float:
+    port = free_port()
+    start = time.perf_counter()
+    process = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "server:app", "--port", str(port), "--log-level", "warning"],
+        cwd=BACKEND_DIR, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
+    )
+    try:
+        while time.perf_counter() - start < timeout:
+            try:
+                response = requests.get(f"http://127.0.0.1:{port}/api/health", timeout=1)
+                if response.status_code == 200:
+                    return (time.perf_counter() - start) * 1000
+            except requests.exceptions.ConnectionError:
+                pass
+            if process.poll() is not None:
+                raise RuntimeError(f"uvicorn exited with code {process.returncode}")
+            time.sleep(0.01)
+        raise RuntimeError("Server did not answer in time")
+    finally:
+        process.terminate()
+        process.wait()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark backend import and startup time")
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--import-budget-ms', type=float, default=IMPORT_BUDGET_MS)
+    parser.add_argument('--first-request-budget-ms', type=float, default=FIRST_REQUEST_BUDGET_MS)
+    parser.add_argument('--skip-server', action='store_true', help="only measure import time")
+    args = parser.parse_args()
+
+    # Importing must not need a database; the server only needs a URL to
+    # build its (lazily connecting) client, /api/health never touches it.
+    import_env = {k: v for k, v in os.environ.items() if k not in ("MONGO_URL", "DB_NAME")}
+    server_env = {"MONGO_URL": "mongodb://localhost:27017", "DB_NAME": "bench_startup", **os.environ}
+
+    import_times = []
+    slowest = []
+    for _ in range(args.repeat):
+        total, slowest = measure_import(import_env)
+        import_times.append(total)
+    import_ms = statistics.median(import_times)
+
+    print(f"import server: {import_ms:.0f} ms median (budget {args.import_budget_ms:.0f} ms)")
+    for ms, module in slowest:
+        print(f"  {module:<30} {ms:8.1f} ms")
+    failed = import_ms > args.import_budget_ms
+
+    if not args.skip_server:
+        first_request_ms = statistics.median(measure_first_request(server_env) for _ in range(args.repeat))
+        print(f"first request: {first_request_ms:.0f} ms median (budget {args.first_request_budget_ms:.0f} ms)")
+        failed = failed or first_request_ms > args.first_request_budget_ms
+
+    if failed:
+        print("Startup budget exceeded")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,180 @@
+"""Per-route latency of the API on each storage backend.
+
+Starts the server once per backend (uvicorn, same box), seeds it with users
+and scores through the API, then times every route and prints p50/p95 side by
+side:
+
+    python bench_storage.py --backends sqlite,mongo --requests 300
+
+The mongo run uses MONGO_URL and a throwaway database, dropped afterwards; the
+sqlite run uses a temporary file.
+"""
+import argparse
+import os
+import random
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import uuid
+from pathlib import Path
+
+import requests
+
+from bench_startup import BACKEND_DIR, free_port
+
+
+def start_server(backend: str, workdir: Path):
+    port = free_port()
+    env = {**os.environ, "STORAGE_BACKEND": backend}
+    if backend == "sqlite":
+        env["SQLITE_PATH"] = str(workdir / "bench.db")
+    else:
+        env.setdefault("MONGO_URL", "mongodb://localhost:27017")
+        env["DB_NAME"] = f"bench_storage_{uuid.uuid4().hex[:8]}"
+    process = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "server:app", "--port", str(port), "--log-level", "warning"],
+        cwd=BACKEND_DIR, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
+    )
+    base_url = f"http://127.0.0.1:{port}/api"
+    deadline = time.perf_counter() + 30
+    while time.perf_counter() < deadline:
+        try:
+            if requests.get(f"{base_url}/health", timeout=1).status_code == 200:
+                return process, base_url, env
+        except requests.exceptions.ConnectionError:
+            time.sleep(0.05)
+    process.terminate()
+    process.wait()
+    drop_database(env)
+    raise RuntimeError(f"{backend} server did not start")
+
+
+def drop_database(env: dict):
+    """Drop the throwaway Mongo database of a run, if it used one."""
+    if env["STORAGE_BACKEND"] != "mongo":
+        return
+    from pymongo import MongoClient
+
+    client = MongoClient(env["MONGO_URL"])
+    try:
+        client.drop_database(env["DB_NAME"])
+    finally:
+        client.close()
+
+
+def seed(session: requests.Session, base_url: str, users: int, scores_per_user: int):
+    user_ids = []
+    for i in range(users):
+        user = session.post(f"{base_url}/users", json={"username": f"bench_{i}_{uuid.uuid4().hex[:6]}", "password": "pw"}).json()
+        user_ids.append((user["id"], user["username"]))
+        for _ in range(scores_per_user):
+            session.post(f"{base_url}/scores", json={
+                "user_id": user["id"], "username": user["username"], "score": random.randint(0, 100_000),
+                "level_reached": random.randint(1, 8), "coins_collected": random.randint(0, 200), "game_duration": 120
+            })
+    return user_ids
+
+
+def routes(base_url: str, user_ids):
+    """(name, callable(session)) pairs; each callable issues one request."""
+    def pick():
+        return random.choice(user_ids)
+
+    def create_user(session):
+        return session.post(f"{base_url}/users", json={"username": f"u_{uuid.uuid4().hex}", "password": "pw"})
+
+    def login(session):
+        user_id, username = pick()
+        return session.post(f"{base_url}/auth/login", json={"username": username, "password": "pw"})
+
+    def get_user(session):
+        return session.get(f"{base_url}/users/{pick()[0]}")
+
+    def create_score(session):
+        user_id, username = pick()
+        return session.post(f"{base_url}/scores", json={
+            "user_id": user_id, "username": username, "score": random.randint(0, 100_000),
+            "level_reached": 1, "coins_collected": 3, "game_duration": 60
+        })
+
+    def leaderboard(session):
+        return session.get(f"{base_url}/scores?limit=10")
+
+    def user_scores(session):
+        return session.get(f"{base_url}/scores/user/{pick()[0]}")
+
+    def save_progress(session):
+        return session.post(f"{base_url}/progress", json={
+            "user_id": pick()[0], "current_level": 2, "lives_remaining": 3, "score": 100, "coins": 5,
+            "power_ups": ["mushroom"], "last_checkpoint": {"x": 120, "y": 300}
+        })
+
+    def get_progress(session):
+        return session.get(f"{base_url}/progress/{pick()[0]}")
+
+    def global_stats(session):
+        return session.get(f"{base_url}/stats/global")
+
+    return [
+        ("POST /users", create_user),
+        ("POST /auth/login", login),
+        ("GET /users/{id}", get_user),
+        ("POST /scores", create_score),
+        ("GET /scores", leaderboard),
+        ("GET /scores/user/{id}", user_scores),
+        ("POST /progress", save_progress),
+        ("GET /progress/{id}", get_progress),
+        ("GET /stats/global", global_stats),
+    ]
+
+
+def run_backend(backend: str, args) -> dict:
+    with tempfile.TemporaryDirectory() as tmp:
+        process, base_url, env = start_server(backend, Path(tmp))
+        try:
+            session = requests.Session()
+            user_ids = seed(session, base_url, args.users, args.scores_per_user)
+            results = {}
+            for name, call in routes(base_url, user_ids):
+                for _ in range(args.warmup):
+                    call(session)
+                timings = []
+                for _ in range(args.requests):
+                    start = time.perf_counter()
+                    response = call(session)
+                    timings.append((time.perf_counter() - start) * 1000)
+                    if response.status_code >= 500:
+                        raise RuntimeError(f"{backend} {name}: {response.status_code} {response.text}")
+                timings.sort()
+                results[name] = (statistics.median(timings), timings[int(len(timings) * 0.95) - 1])
+            return results
+        finally:
+            process.terminate()
+            process.wait()
+            drop_database(env)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare per-route latency across storage backends")
+    parser.add_argument('--backends', default="sqlite,mongo")
+    parser.add_argument('--requests', type=int, default=200, help="timed requests per route")
+    parser.add_argument('--warmup', type=int, default=20)
+    parser.add_argument('--users', type=int, default=100)
+    parser.add_argument('--scores-per-user', type=int, default=10)
+    args = parser.parse_args()
+
+    backends = [b.strip() for b in args.backends.split(",") if b.strip()]
+    results = {backend: run_backend(backend, args) for backend in backends}
+
+    header = f"{'route':<24}" + "".join(f"{backend + ' p50/p95 ms':>24}" for backend in backends)
+    print(header)
+    print("-" * len(header))
+    for name in results[backends[0]]:
+        cells = "".join(f"{results[b][name][0]:>15.2f} / {results[b][name][1]:<6.2f}" for b in backends)
+        print(f"{name:<24}{cells}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,111 @@
+"""Sustained throughput benchmark for telemetry ingestion.
+
+Simulates many clients posting gzip-compressed event batches: each batch is
+decoded, validated and appended to a TelemetryBuffer while the background
+flusher drains it with insert_many. Without --mongo, writes go to an in-memory
+collection that sleeps for --insert-latency per insert_many call, which
+approximates a network round trip to Mongo.
+
+    python bench_telemetry.py --seconds 10 --clients 50 --batch 200
+    python bench_telemetry.py --mongo   # uses MONGO_URL / DB_NAME
+"""
+import argparse
+import asyncio
+import gzip
+import json
+import os
+import random
+import time
+import uuid
+from pathlib import Path
+
+from telemetry import EVENT_TYPES, TelemetryBuffer, build_documents, decode_payload
+
+
+class SimulatedCollection:
+    def __init__(self, latency: float):
+        self.latency = latency
+        self.inserted = 0
+        self.calls = 0
+
+    async def insert_many(self, documents, ordered=True):
+        await asyncio.sleep(self.latency)
+        self.calls += 1
+        self.inserted += len(documents)
+
+
+def make_body(batch_size: int) -> bytes:
+    event_types = sorted(EVENT_TYPES)
+    events = [
+        {"type": random.choice(event_types), "t": i * 16, "level": 1, "x": random.randint(0, 4000), "y": random.randint(0, 600)}
+        for i in range(batch_size)
+    ]
+    payload = {"run_id": str(uuid.uuid4()), "user_id": str(uuid.uuid4()), "events": events}
+    return gzip.compress(json.dumps(payload).encode())
+
+
+async def client_loop(buffer: TelemetryBuffer, body: bytes, deadline: float, counters: dict):
+    while time.perf_counter() < deadline:
+        documents = build_documents(decode_payload(body, "gzip"))
+        if buffer.append(documents):
+            counters["batches"] += 1
+        else:
+            counters["backpressure"] += 1
+            await asyncio.sleep(0.05)
+        # Yield like a real request handler would between requests
+        await asyncio.sleep(0)
+
+
+async def run(args):
+    if args.mongo:
+        from dotenv import load_dotenv
+        from motor.motor_asyncio import AsyncIOMotorClient
+
+        load_dotenv(Path(__file__).parent / '.env')
+        client = AsyncIOMotorClient(os.environ['MONGO_URL'])
+        collection = client[os.environ['DB_NAME']]["bench_game_events"]
+        await collection.drop()
+    else:
+        client = None
+        collection = SimulatedCollection(args.insert_latency)
+
+    buffer = TelemetryBuffer(collection, capacity=args.capacity, flush_size=args.flush_size, flush_interval=args.flush_interval)
+    body = make_body(args.batch)
+    counters = {"batches": 0, "backpressure": 0}
+
+    buffer.start()
+    start = time.perf_counter()
+    deadline = start + args.seconds
+    await asyncio.gather(*(client_loop(buffer, body, deadline, counters) for _ in range(args.clients)))
+    ingest_elapsed = time.perf_counter() - start
+    await buffer.stop()
+    total_elapsed = time.perf_counter() - start
+
+    print(f"compressed batch: {len(body)} bytes for {args.batch} events")
+    print(f"accepted:  {buffer.accepted} events ({counters['batches']} batches)")
+    print(f"refused:   {counters['backpressure']} batches (backpressure)")
+    print(f"ingest:    {buffer.accepted / ingest_elapsed:,.0f} events/s")
+    print(f"persisted: {buffer.flushed / total_elapsed:,.0f} events/s (incl. final drain)")
+    if isinstance(collection, SimulatedCollection):
+        print(f"insert_many calls: {collection.calls} (vs {buffer.flushed} single inserts)")
+
+    if client is not None:
+        await collection.drop()
+        client.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark telemetry ingestion throughput")
+    parser.add_argument('--seconds', type=float, default=5.0)
+    parser.add_argument('--clients', type=int, default=50)
+    parser.add_argument('--batch', type=int, default=200, help="events per request")
+    parser.add_argument('--capacity', type=int, default=100_000)
+    parser.add_argument('--flush-size', type=int, default=2000)
+    parser.add_argument('--flush-interval', type=float, default=1.0)
+    parser.add_argument('--insert-latency', type=float, default=0.005, help="simulated insert_many latency (s)")
+    parser.add_argument('--mongo', action='store_true', help="write to the real database instead of a simulated one")
+    asyncio.run(run(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,271 @@
+"""Columnar export of game collections to Parquet/Arrow files.
+
+Documents are streamed out of Mongo in fixed-size batches, converted to typed
+pandas frames and written as one file per batch and date partition, so memory
+stays bounded by the batch size regardless of collection size:
+
+    <out_dir>/<collection>/date=YYYY-MM-DD/part-<run>-<seq>.parquet
+
+Documents without a timestamp land in ``date=__null__``.
+
+A per-collection watermark is kept in ``<out_dir>/_watermarks.json`` so later
+runs can export incrementally. Timestamps are set by the API before the insert
+runs, so a document can commit after newer ones are already visible; each run
+therefore stops ``lag`` seconds before its start and records that cutoff,
+rather than the newest timestamp it read, as the watermark.
+
+Run from the backend directory:
+
+    python export.py --out ./exports --incremental
+"""
+import argparse
+import asyncio
+import json
+import os
+import uuid
+from datetime import datetime, timedelta
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+import pandas as pd
+import pyarrow as pa
+import pyarrow.feather as feather
+import pyarrow.parquet as pq
+
+from export_collections import EXPORT_COLLECTIONS, EXPORT_TIMESTAMP_FIELDS
+
+
+DEFAULT_BATCH_SIZE = 5000
+# Seconds between a run's cutoff and its start, see module docstring
+DEFAULT_LAG = 60.0
+# Partition for documents missing their timestamp field
+NULL_PARTITION = '__null__'
+WATERMARK_FILE = '_watermarks.json'
+FORMATS = {'parquet': 'parquet', 'arrow': 'arrow'}
+
+# Column layout per collection. The timestamp field doubles as partition key
+# and watermark; password hashes are never exported.
+EXPORT_SCHEMAS: Dict[str, dict] = {
+    "scores": {
+        "timestamp_field": EXPORT_TIMESTAMP_FIELDS["scores"],
+        "schema": pa.schema([
+            ("id", pa.string()),
+            ("user_id", pa.string()),
+            ("username", pa.string()),
+            ("score", pa.int64()),
+            ("level_reached", pa.int32()),
+            ("coins_collected", pa.int64()),
+            ("game_duration", pa.int32()),
+            ("created_at", pa.timestamp("ms")),
+        ]),
+    },
+    "users": {
+        "timestamp_field": EXPORT_TIMESTAMP_FIELDS["users"],
+        "schema": pa.schema([
+            ("id", pa.string()),
+            ("username", pa.string()),
+            ("email", pa.string()),
+            ("high_score", pa.int64()),
+            ("total_coins", pa.int64()),
+            ("levels_completed", pa.int32()),
+            ("created_at", pa.timestamp("ms")),
+        ]),
+    },
+    "game_progress": {
+        "timestamp_field": EXPORT_TIMESTAMP_FIELDS["game_progress"],
+        "schema": pa.schema([
+            ("id", pa.string()),
+            ("user_id", pa.string()),
+            ("current_level", pa.int32()),
+            ("lives_remaining", pa.int32()),
+            ("score", pa.int64()),
+            ("coins", pa.int64()),
+            ("power_ups", pa.list_(pa.string())),
+            ("last_checkpoint", pa.string()),
+            ("updated_at", pa.timestamp("ms")),
+        ]),
+    },
+}
+
+# Nullable pandas dtypes, so missing fields stay null instead of becoming 0
+_INTEGER_DTYPES = {
+    pa.int32(): "Int32",
+    pa.int64(): "Int64",
+}
+
+
+def load_watermarks(out_dir: Path) -> Dict[str, datetime]:
+    path = out_dir / WATERMARK_FILE
+    if not path.exists():
+        return {}
+    raw = json.loads(path.read_text())
+    return {name: datetime.fromisoformat(value) for name, value in raw.items()}
+
+
+def save_watermarks(out_dir: Path, watermarks: Dict[str, datetime]):
+    path = out_dir / WATERMARK_FILE
+    tmp_path = path.with_suffix('.tmp')
+    tmp_path.write_text(json.dumps({name: value.isoformat() for name, value in watermarks.items()}, indent=2))
+    tmp_path.replace(path)
+
+
+def documents_to_frame(collection: str, documents: List[dict]) -> pd.DataFrame:
+    """Project raw Mongo documents onto the typed export columns."""
+    spec = EXPORT_SCHEMAS[collection]
+    columns = {}
+    for field in spec["schema"]:
+        values = [doc.get(field.name) for doc in documents]
+        if field.type in _INTEGER_DTYPES:
+            columns[field.name] = pd.array(values, dtype=_INTEGER_DTYPES[field.type])
+        elif pa.types.is_timestamp(field.type):
+            columns[field.name] = pd.to_datetime(values)
+        elif pa.types.is_list(field.type):
+            columns[field.name] = [list(v or []) for v in values]
+        elif field.name == "last_checkpoint":
+            columns[field.name] = [json.dumps(v or {}, default=str) for v in values]
+        else:
+            columns[field.name] = values
+    return pd.DataFrame(columns)
+
+
+def write_batch(collection: str, frame: pd.DataFrame, out_dir: Path, run_id: str, seq: int,
+                fmt: str = 'parquet') -> Tuple[List[Path], int]:
+    """Write one batch, split by date partition. Returns the files and row count written."""
+    spec = EXPORT_SCHEMAS[collection]
+    dates = frame[spec["timestamp_field"]].dt.strftime('%Y-%m-%d').fillna(NULL_PARTITION)
+    written = []
+    rows = 0
+    for date, part in frame.groupby(dates, sort=True, dropna=False):
+        partition_dir = out_dir / collection / f"date={date}"
+        partition_dir.mkdir(parents=True, exist_ok=True)
+        path = partition_dir / f"part-{run_id}-{seq:05d}.{FORMATS[fmt]}"
+        table = pa.Table.from_pandas(part, schema=spec["schema"], preserve_index=False)
+        if fmt == 'arrow':
+            feather.write_feather(table, path, compression='zstd')
+        else:
+            pq.write_table(table, path, compression='zstd')
+        written.append(path)
+        rows += table.num_rows
+    return written, rows
+
+
+async def export_collection(db, collection: str, out_dir: Path, since: Optional[datetime] = None,
+                            until: Optional[datetime] = None, batch_size: int = DEFAULT_BATCH_SIZE, fmt: str = 'parquet',
+                            run_id: Optional[str] = None) -> dict:
+    """Stream ``collection`` into columnar files, optionally only rows in ``(since, until]``.
+
+    The returned watermark is ``until`` when given, else the newest timestamp read.
+    """
+    if collection not in EXPORT_SCHEMAS:
+        raise ValueError(f"Unknown collection: {collection}")
+    if fmt not in FORMATS:
+        raise ValueError(f"Unknown format: {fmt}")
+
+    spec = EXPORT_SCHEMAS[collection]
+    timestamp_field = spec["timestamp_field"]
+    run_id = run_id or uuid.uuid4().hex[:8]
+    bounds = {}
+    if since is not None:
+        bounds["$gt"] = since
+    if until is not None:
+        bounds["$lte"] = until
+    if since is not None:
+        query = {timestamp_field: bounds}
+    elif bounds:
+        # A full export still picks up documents without a timestamp
+        query = {"$or": [{timestamp_field: bounds}, {timestamp_field: None}]}
+    else:
+        query = {}
+    projection = {"_id": 0, **{field.name: 1 for field in spec["schema"]}}
+
+    cursor = db[collection].find(query, projection).sort(timestamp_field, 1).batch_size(batch_size)
+
+    rows = 0
+    files = 0
+    seq = 0
+    watermark = since
+    batch = []
+
+    async def flush():
+        nonlocal rows, files, seq, watermark
+        frame = documents_to_frame(collection, batch)
+        written, written_rows = await asyncio.to_thread(write_batch, collection, frame, out_dir, run_id, seq, fmt)
+        rows += written_rows
+        files += len(written)
+        seq += 1
+        timestamps = [doc[timestamp_field] for doc in batch if doc.get(timestamp_field) is not None]
+        if timestamps:
+            watermark = max(timestamps) if watermark is None else max(watermark, *timestamps)
+        batch.clear()
+
+    async for document in cursor:
+        batch.append(document)
+        if len(batch) >= batch_size:
+            await flush()
+    if batch:
+        await flush()
+
+    if until is not None:
+        watermark = until if watermark is None else max(watermark, until)
+    return {"collection": collection, "rows": rows, "files": files, "watermark": watermark}
+
+
+async def run_export(db, out_dir: Path, collections: Optional[List[str]] = None, incremental: bool = False,
+                     since: Optional[datetime] = None, batch_size: int = DEFAULT_BATCH_SIZE, fmt: str = 'parquet',
+                     lag: float = DEFAULT_LAG) -> List[dict]:
+    """Export several collections, advancing the stored watermarks on success."""
+    out_dir = Path(out_dir)
+    out_dir.mkdir(parents=True, exist_ok=True)
+    watermarks = load_watermarks(out_dir)
+    started = datetime.utcnow()
+    run_id = started.strftime('%Y%m%dT%H%M%S') + '-' + uuid.uuid4().hex[:6]
+    until = started - timedelta(seconds=lag)
+
+    results = []
+    for collection in collections or EXPORT_COLLECTIONS:
+        start = since
+        if incremental and start is None:
+            start = watermarks.get(collection)
+        result = await export_collection(db, collection, out_dir, since=start, until=until, batch_size=batch_size,
+                                         fmt=fmt, run_id=run_id)
+        if result["watermark"] is not None:
+            previous = watermarks.get(collection)
+            if previous is None or result["watermark"] > previous:
+                watermarks[collection] = result["watermark"]
+            save_watermarks(out_dir, watermarks)
+        results.append(result)
+    return results
+
+
+def main():
+    from dotenv import load_dotenv
+    from motor.motor_asyncio import AsyncIOMotorClient
+
+    load_dotenv(Path(__file__).parent / '.env')
+
+    parser = argparse.ArgumentParser(description="Export game collections to Parquet/Arrow files")
+    parser.add_argument('--out', default=os.environ.get('EXPORT_DIR', 'exports'), help="output directory")
+    parser.add_argument('--collection', action='append', choices=EXPORT_COLLECTIONS, dest='collections',
+                        help="collection to export (repeatable, default: all)")
+    parser.add_argument('--since', type=datetime.fromisoformat, help="only export rows newer than this ISO timestamp")
+    parser.add_argument('--incremental', action='store_true', help="resume from the stored watermarks")
+    parser.add_argument('--batch-size', type=int, default=DEFAULT_BATCH_SIZE)
+    parser.add_argument('--format', choices=list(FORMATS), default='parquet', dest='fmt')
+    parser.add_argument('--lag', type=float, default=DEFAULT_LAG,
+                        help="seconds before now to stop at, for inserts still in flight")
+    args = parser.parse_args()
+
+    client = AsyncIOMotorClient(os.environ['MONGO_URL'])
+    db = client[os.environ['DB_NAME']]
+    try:
+        results = asyncio.run(run_export(db, Path(args.out), collections=args.collections, incremental=args.incremental,
+                                         since=args.since, batch_size=args.batch_size, fmt=args.fmt, lag=args.lag))
+    finally:
+        client.close()
+
+    for result in results:
+        print(f"{result['collection']}: {result['rows']} rows in {result['files']} files (watermark: {result['watermark']})")
+
+
+if __name__ == "__main__":
+    main()
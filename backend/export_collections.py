@@ -0,0 +1,13 @@
+"""Collections covered by the analytics export (export.py).
+
+Kept free of pandas/pyarrow so server.py can validate export requests
+without importing them.
+"""
+
+# Collection name -> timestamp field used as date partition and watermark
+EXPORT_TIMESTAMP_FIELDS = {
+    "scores": "created_at",
+    "users": "created_at",
+    "game_progress": "updated_at",
+}
+EXPORT_COLLECTIONS = list(EXPORT_TIMESTAMP_FIELDS)
@@ -0,0 +1,151 @@
+"""Micro-batched key lookups shared across concurrent requests.
+
+``BatchLoader.load(key)`` doesn't query right away: keys requested during the
+same event-loop tick are collected and fetched together with a single
+``fetch_many(keys)`` call (one ``$in`` query for Mongo). On top of that:
+
+* concurrent loads of the same key share one in-flight future
+* keys the backend didn't return are remembered as missing for
+  ``negative_ttl`` seconds, so probing for a non-existent id doesn't cost a
+  round trip every time
+* within one request (see LoaderScopeMiddleware) a key is fetched at most
+  once; found documents are not cached across requests, so updates are
+  always visible to the next request
+"""
+import asyncio
+import contextvars
+import time
+from typing import Awaitable, Callable, Dict, List, Optional, Set
+
+
+_request_cache: contextvars.ContextVar = contextvars.ContextVar("loader_request_cache", default=None)
+
+MAX_NEGATIVE_ENTRIES = 10_000
+
+
+class BatchLoader:
+    def __init__(self, fetch_many: Callable[[List[str]], Awaitable[List[dict]]], key: str = "id",
+                 negative_ttl: float = 1.0, max_batch_size: int = 500):
+        self.fetch_many = fetch_many
+        self.key = key
+        self.negative_ttl = negative_ttl
+        self.max_batch_size = max_batch_size
+        self._pending: Dict[str, asyncio.Future] = {}
+        self._in_flight: Dict[str, asyncio.Future] = {}
+        self._missing: Dict[str, float] = {}
+        # The event loop only keeps weak references to tasks
+        self._tasks: Set[asyncio.Task] = set()
+        self._scheduled = False
+        self.loads = 0
+        self.batches = 0
+        self.fetched_keys = 0
+
+    async def load(self, key: str) -> Optional[dict]:
+        self.loads += 1
+        request_cache = _request_cache.get()
+        if request_cache is not None and key in request_cache:
+            return request_cache[key]
+
+        expires = self._missing.get(key)
+        if expires is not None:
+            if expires > time.monotonic():
+                return None
+            del self._missing[key]
+
+        future = self._pending.get(key) or self._in_flight.get(key)
+        if future is None:
+            future = asyncio.get_running_loop().create_future()
+            self._pending[key] = future
+            if not self._scheduled:
+                self._scheduled = True
+                asyncio.get_running_loop().call_soon(self._dispatch)
+
+        # shield: one caller being cancelled must not cancel the shared lookup
+        result = await asyncio.shield(future)
+        if request_cache is not None:
+            request_cache[key] = result
+        return result
+
+    def clear(self, key: str):
+        """Forget anything known about ``key`` (call after inserts/updates).
+
+        A fetch already in flight may have read the old row: it still answers
+        its current waiters, but later loads start a new batch and its result
+        is not cached. Pending keys are left alone, their batch hasn't been
+        sent yet and will see the write.
+        """
+        self._missing.pop(key, None)
+        self._in_flight.pop(key, None)
+        request_cache = _request_cache.get()
+        if request_cache is not None:
+            request_cache.pop(key, None)
+
+    def _dispatch(self):
+        self._scheduled = False
+        pending, self._pending = self._pending, {}
+        keys = list(pending)
+        for start in range(0, len(keys), self.max_batch_size):
+            chunk = {key: pending[key] for key in keys[start:start + self.max_batch_size]}
+            self._in_flight.update(chunk)
+            task = asyncio.ensure_future(self._fetch(chunk))
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
+
+    async def _fetch(self, futures: Dict[str, asyncio.Future]):
+        self.batches += 1
+        self.fetched_keys += len(futures)
+        try:
+            documents = await self.fetch_many(list(futures))
+        except BaseException as e:
+            # Never leave waiters hanging, including when the fetch is cancelled
+            for future in futures.values():
+                if not future.done():
+                    if isinstance(e, Exception):
+                        future.set_exception(e)
+                    else:
+                        future.cancel()
+            if not isinstance(e, Exception):
+                raise
+            return
+        finally:
+            # Keys cleared meanwhile were detached and may have a newer fetch
+            current = {key for key, future in futures.items() if self._in_flight.get(key) is future}
+            for key in current:
+                del self._in_flight[key]
+
+        found = {document[self.key]: document for document in documents}
+        now = time.monotonic()
+        if len(self._missing) > MAX_NEGATIVE_ENTRIES:
+            self._missing = {key: expires for key, expires in self._missing.items() if expires > now}
+        expires = now + self.negative_ttl
+        for key, future in futures.items():
+            document = found.get(key)
+            if document is None and self.negative_ttl > 0 and key in current:
+                self._missing[key] = expires
+            if not future.done():
+                future.set_result(document)
+
+    def stats(self) -> dict:
+        return {
+            "loads": self.loads,
+            "batches": self.batches,
+            "fetched_keys": self.fetched_keys,
+            "negative_cache": len(self._missing),
+        }
+
+
+class LoaderScopeMiddleware:
+    """ASGI middleware giving each request its own loader memo."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        token = _request_cache.set({})
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            _request_cache.reset(token)
@@ -0,0 +1,349 @@
+"""Opt-in per-request profiling and slow-request capture.
+
+When enabled (at runtime, through the admin API), a sampled fraction of
+requests -- or every request to a single route -- records where its time
+went:
+
+* ``validation``    request parsing into pydantic models (FastAPI dependencies)
+* ``handler``       the endpoint body itself, minus the database calls below
+* ``db:<coll>.<op>`` each awaited storage call made from the handler
+* ``serialization`` response model validation, encoding and rendering
+* ``framework``     everything else (routing, middleware, sending)
+
+The first three route phases come from ProfiledRoute, set as ``route_class``
+on the API router; nothing in FastAPI itself is patched.
+
+Requests slower than the threshold are kept in a bounded ring buffer and can
+be exported as folded stacks, which flamegraph.pl and speedscope read
+directly.
+
+CPU times come from ``time.thread_time`` around each span. While a span is
+awaiting, other requests may run on the same thread, so under concurrency
+CPU figures are an upper bound; wall times are exact.
+
+Work shared between requests runs in its own task, which copies the context
+of whichever request started it: a BatchLoader fetch would be charged to the
+first caller only. Shared lookups are therefore not wrapped in
+ProfiledDatabase; instead each caller times its own wait with ``timed`` (for
+example ``db:users.load`` in server.py).
+"""
+import asyncio
+import contextvars
+import functools
+import random
+import time
+from collections import deque
+from typing import Callable, List, Optional
+
+from fastapi.routing import APIRoute
+
+
+_current_profile: contextvars.ContextVar = contextvars.ContextVar("current_profile", default=None)
+
+
+class RequestProfile:
+    def __init__(self, method: str, path: str):
+        self.method = method
+        self.path = path
+        self.route: Optional[str] = None
+        self.status: Optional[int] = None
+        self.started_at = time.time()
+        self.wall_ms = 0.0
+        self.cpu_ms = 0.0
+        self.phases = {}
+        # (start, end) clocks of the endpoint call, set by ProfiledRoute
+        self.endpoint_span = None
+
+    def add(self, name: str, wall: float, cpu: float):
+        phase = self.phases.setdefault(name, [0.0, 0.0, 0])
+        phase[0] += wall * 1000
+        phase[1] += cpu * 1000
+        phase[2] += 1
+
+    def breakdown(self) -> dict:
+        """Per-phase totals with nested database time moved out of ``handler``."""
+        phases = {name: list(values) for name, values in self.phases.items()}
+        db_wall = sum(v[0] for name, v in phases.items() if name.startswith("db:"))
+        db_cpu = sum(v[1] for name, v in phases.items() if name.startswith("db:"))
+        if "handler" in phases:
+            phases["handler"][0] = max(0.0, phases["handler"][0] - db_wall)
+            phases["handler"][1] = max(0.0, phases["handler"][1] - db_cpu)
+        accounted_wall = sum(v[0] for v in phases.values())
+        accounted_cpu = sum(v[1] for v in phases.values())
+        phases["framework"] = [max(0.0, self.wall_ms - accounted_wall), max(0.0, self.cpu_ms - accounted_cpu), 1]
+        return {
+            name: {"wall_ms": round(wall, 3), "cpu_ms": round(cpu, 3), "calls": calls}
+            for name, (wall, cpu, calls) in phases.items()
+        }
+
+    def to_dict(self) -> dict:
+        return {
+            "method": self.method,
+            "path": self.path,
+            "route": self.route,
+            "status": self.status,
+            "started_at": self.started_at,
+            "wall_ms": round(self.wall_ms, 3),
+            "cpu_ms": round(self.cpu_ms, 3),
+            "phases": self.breakdown(),
+        }
+
+    def folded(self) -> List[str]:
+        """Folded-stack lines (``frame;frame;frame value``), value in microseconds."""
+        root = f"{self.method} {self.route or self.path}"
+        lines = []
+        for name, phase in self.breakdown().items():
+            if name.startswith("db:"):
+                stack = f"{root};handler;{name}"
+            else:
+                stack = f"{root};{name}"
+            micros = int(phase["wall_ms"] * 1000)
+            if micros:
+                lines.append(f"{stack} {micros}")
+        return lines
+
+
+async def _timed(name: str, awaitable, profile: RequestProfile):
+    wall, cpu = time.perf_counter(), time.thread_time()
+    try:
+        return await awaitable
+    finally:
+        profile.add(name, time.perf_counter() - wall, time.thread_time() - cpu)
+
+
+def timed(name: str, awaitable):
+    """Record ``awaitable`` as phase ``name`` of the current request's profile, if any."""
+    profile = _current_profile.get()
+    if profile is None:
+        return awaitable
+    return _timed(name, awaitable, profile)
+
+
+class Profiler:
+    """Runtime-configurable sampling settings and the slow-request ring buffer."""
+
+    def __init__(self, buffer_size: int = 100):
+        self.enabled = False
+        self.sample_rate = 0.0
+        self.route: Optional[str] = None
+        self.slow_ms = 500.0
+        self.profiled = 0
+        self.slow_requests = deque(maxlen=buffer_size)
+
+    def configure(self, enabled: Optional[bool] = None, sample_rate: Optional[float] = None, route: Optional[str] = None,
+                  slow_ms: Optional[float] = None, buffer_size: Optional[int] = None):
+        """Change the given settings. Nothing changes if any of them is invalid."""
+        if sample_rate is not None and not 0.0 <= sample_rate <= 1.0:
+            raise ValueError("sample_rate must be between 0 and 1")
+        if slow_ms is not None and slow_ms < 0:
+            raise ValueError("slow_ms must not be negative")
+        if buffer_size is not None and buffer_size < 0:
+            raise ValueError("buffer_size must not be negative")
+
+        if enabled is not None:
+            self.enabled = enabled
+        if sample_rate is not None:
+            self.sample_rate = sample_rate
+        if route is not None:
+            # An empty string clears the route filter
+            self.route = route or None
+        if slow_ms is not None:
+            self.slow_ms = slow_ms
+        if buffer_size is not None and buffer_size != self.slow_requests.maxlen:
+            self.slow_requests = deque(self.slow_requests, maxlen=buffer_size)
+
+    def settings(self) -> dict:
+        return {
+            "enabled": self.enabled,
+            "sample_rate": self.sample_rate,
+            "route": self.route,
+            "slow_ms": self.slow_ms,
+            "buffer_size": self.slow_requests.maxlen,
+            "profiled": self.profiled,
+            "captured": len(self.slow_requests),
+        }
+
+    def should_profile(self) -> bool:
+        if not self.enabled:
+            return False
+        # With a route filter every request is profiled and non-matching ones
+        # are dropped once routing has resolved the route template.
+        return self.route is not None or random.random() < self.sample_rate
+
+    def record(self, profile: RequestProfile):
+        if self.route is not None and self.route not in (profile.route, profile.path):
+            return
+        self.profiled += 1
+        if profile.wall_ms >= self.slow_ms:
+            self.slow_requests.append(profile)
+
+    def folded(self) -> str:
+        return "\n".join(line for profile in self.slow_requests for line in profile.folded()) + "\n"
+
+
+class ProfilingMiddleware:
+    """ASGI middleware that attaches a RequestProfile to sampled requests."""
+
+    def __init__(self, app, profiler: Profiler):
+        self.app = app
+        self.profiler = profiler
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not self.profiler.should_profile():
+            await self.app(scope, receive, send)
+            return
+
+        profile = RequestProfile(scope["method"], scope["path"])
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                profile.status = message["status"]
+            await send(message)
+
+        token = _current_profile.set(profile)
+        wall, cpu = time.perf_counter(), time.thread_time()
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            profile.wall_ms = (time.perf_counter() - wall) * 1000
+            profile.cpu_ms = (time.thread_time() - cpu) * 1000
+            _current_profile.reset(token)
+            self.profiler.record(profile)
+
+
+def _clock():
+    return time.perf_counter(), time.thread_time()
+
+
+def _add_span(profile: RequestProfile, name: str, start, end):
+    profile.add(name, end[0] - start[0], end[1] - start[1])
+
+
+def _timed_endpoint(endpoint: Callable):
+    """Wrap an async endpoint to record when it starts and ends on the current profile."""
+    @functools.wraps(endpoint)
+    async def profiled_endpoint(*args, **kwargs):
+        profile = _current_profile.get()
+        if profile is None:
+            return await endpoint(*args, **kwargs)
+        start = _clock()
+        try:
+            return await endpoint(*args, **kwargs)
+        finally:
+            profile.endpoint_span = (start, _clock())
+    return profiled_endpoint
+
+
+class ProfiledRoute(APIRoute):
+    """APIRoute that splits profiled requests into validation, handler and serialization.
+
+    The endpoint's start and end divide the route handler's time: before it
+    is dependency solving and request validation, after it is response
+    validation and rendering. Sync endpoints run in a worker thread, so their
+    routes are recorded as ``handler`` as a whole.
+    """
+
+    def __init__(self, path: str, endpoint: Callable, **kwargs):
+        super().__init__(path, endpoint, **kwargs)
+        # The route handler looks dependant.call up per request
+        self._split_phases = asyncio.iscoroutinefunction(self.dependant.call)
+        if self._split_phases:
+            self.dependant.call = _timed_endpoint(self.dependant.call)
+
+    def get_route_handler(self):
+        handler = super().get_route_handler()
+
+        async def profiled_handler(request):
+            profile = _current_profile.get()
+            if profile is None:
+                return await handler(request)
+            profile.route = self.path_format
+            profile.endpoint_span = None
+            start = _clock()
+            try:
+                return await handler(request)
+            finally:
+                end = _clock()
+                span = profile.endpoint_span
+                if not self._split_phases:
+                    _add_span(profile, "handler", start, end)
+                elif span is None:
+                    # Rejected before the endpoint ran
+                    _add_span(profile, "validation", start, end)
+                else:
+                    _add_span(profile, "validation", start, span[0])
+                    _add_span(profile, "handler", span[0], span[1])
+                    _add_span(profile, "serialization", span[1], end)
+        return profiled_handler
+
+
+class ProfiledCursor:
+    """Wraps a Motor cursor so fetching results is timed; chaining is passed through."""
+
+    def __init__(self, cursor, label: str):
+        self._cursor = cursor
+        self._label = label
+
+    def __getattr__(self, name):
+        attr = getattr(self._cursor, name)
+        if not callable(attr):
+            return attr
+
+        def call(*args, **kwargs):
+            result = attr(*args, **kwargs)
+            if result is self._cursor:
+                return self
+            profile = _current_profile.get()
+            if profile is not None and hasattr(result, "__await__"):
+                return _timed(f"{self._label}.{name}", result, profile)
+            return result
+        return call
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+        profile = _current_profile.get()
+        if profile is None:
+            return await self._cursor.__anext__()
+        return await _timed(f"{self._label}.next", self._cursor.__anext__(), profile)
+
+
+class ProfiledCollection:
+    def __init__(self, collection, name: str):
+        self._collection = collection
+        self._label = f"db:{name}"
+
+    def __getattr__(self, name):
+        attr = getattr(self._collection, name)
+        if not callable(attr):
+            return attr
+
+        def call(*args, **kwargs):
+            result = attr(*args, **kwargs)
+            if hasattr(result, "to_list"):
+                return ProfiledCursor(result, f"{self._label}.{name}")
+            profile = _current_profile.get()
+            if profile is not None and hasattr(result, "__await__"):
+                return _timed(f"{self._label}.{name}", result, profile)
+            return result
+        return call
+
+
+class ProfiledDatabase:
+    """Drop-in wrapper for a storage backend (or a Motor database) whose
+    collection/repository calls show up in profiles."""
+
+    def __init__(self, database):
+        self._database = database
+        self._collections = {}
+
+    def __getattr__(self, name):
+        if name.startswith("_"):
+            raise AttributeError(name)
+        collection = self._collections.get(name)
+        if collection is None:
+            collection = self._collections[name] = ProfiledCollection(getattr(self._database, name), name)
+        return collection
+
+    __getitem__ = __getattr__
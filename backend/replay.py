@@ -0,0 +1,171 @@
+"""Compact binary storage for ghost replays.
+
+The game loop is deterministic over the per-frame key state, so a run can be
+replayed from its input stream alone. Each frame's input is packed into a
+bitmask (see ``KEY_BITS``) and consecutive identical frames are collapsed into
+``(mask, length)`` runs. Players hold keys for many frames at a time, so a
+minute of gameplay usually needs only a few hundred bytes.
+
+Binary layout (little-endian, varints are unsigned LEB128)::
+
+    b"RPL" | version u8 | frame_rate u8 | frame_count varint | run_count varint
+    run_count x (mask u8 | length varint)
+"""
+from collections import OrderedDict
+from typing import Iterable, List, Optional, Tuple
+
+
+MAGIC = b"RPL"
+VERSION = 1
+# One bit per KeyboardEvent.code the game engine tracks (GameEngine.js), so a
+# frame's mask is the OR of the bits of every key held during that frame.
+# ArrowUp is recorded even though Player ignores it today; left and right
+# Shift are separate keys in the browser and get separate bits.
+KEY_BITS = {
+    "ArrowLeft": 1 << 0,
+    "ArrowRight": 1 << 1,
+    "ArrowUp": 1 << 2,
+    "Space": 1 << 3,
+    "ShiftLeft": 1 << 4,
+    "ShiftRight": 1 << 5,
+}
+MAX_MASK = sum(KEY_BITS.values())
+MAX_FRAMES = 60 * 60 * 60  # one hour at 60 fps
+
+Run = Tuple[int, int]
+
+
+class ReplayFormatError(ValueError):
+    pass
+
+
+def _write_varint(out: bytearray, value: int):
+    while value >= 0x80:
+        out.append((value & 0x7F) | 0x80)
+        value >>= 7
+    out.append(value)
+
+
+def _read_varint(data: bytes, pos: int) -> Tuple[int, int]:
+    result = 0
+    shift = 0
+    while True:
+        if pos >= len(data):
+            raise ReplayFormatError("Truncated replay data")
+        byte = data[pos]
+        pos += 1
+        result |= (byte & 0x7F) << shift
+        if not byte & 0x80:
+            return result, pos
+        shift += 7
+        if shift > 63:
+            raise ReplayFormatError("Varint too long")
+
+
+def frames_to_runs(frames: Iterable[int]) -> List[Run]:
+    runs: List[Run] = []
+    for mask in frames:
+        if runs and runs[-1][0] == mask:
+            runs[-1] = (mask, runs[-1][1] + 1)
+        else:
+            runs.append((mask, 1))
+    return runs
+
+
+def runs_to_frames(runs: Iterable[Run]) -> List[int]:
+    frames: List[int] = []
+    for mask, length in runs:
+        frames.extend([mask] * length)
+    return frames
+
+
+def normalize_runs(runs: Iterable[Run]) -> List[Run]:
+    """Validate runs and merge adjacent ones with the same mask."""
+    merged: List[Run] = []
+    total = 0
+    for mask, length in runs:
+        if not 0 <= mask <= MAX_MASK:
+            raise ReplayFormatError(f"Invalid key mask: {mask}")
+        if length < 1:
+            raise ReplayFormatError(f"Invalid run length: {length}")
+        total += length
+        if total > MAX_FRAMES:
+            raise ReplayFormatError("Replay too long")
+        if merged and merged[-1][0] == mask:
+            merged[-1] = (mask, merged[-1][1] + length)
+        else:
+            merged.append((mask, length))
+    return merged
+
+
+def encode_replay(runs: Iterable[Run], frame_rate: int = 60) -> bytes:
+    runs = normalize_runs(runs)
+    if not 1 <= frame_rate <= 255:
+        raise ReplayFormatError(f"Invalid frame rate: {frame_rate}")
+    out = bytearray(MAGIC)
+    out.append(VERSION)
+    out.append(frame_rate)
+    _write_varint(out, sum(length for _, length in runs))
+    _write_varint(out, len(runs))
+    for mask, length in runs:
+        out.append(mask)
+        _write_varint(out, length)
+    return bytes(out)
+
+
+def decode_replay(data: bytes) -> dict:
+    """Decode stored replay bytes into ``{"frame_rate", "frame_count", "runs"}``."""
+    if len(data) < 5 or data[:3] != MAGIC:
+        raise ReplayFormatError("Not a replay")
+    if data[3] != VERSION:
+        raise ReplayFormatError(f"Unsupported replay version: {data[3]}")
+    frame_rate = data[4]
+    frame_count, pos = _read_varint(data, 5)
+    run_count, pos = _read_varint(data, pos)
+    runs: List[Run] = []
+    for _ in range(run_count):
+        if pos >= len(data):
+            raise ReplayFormatError("Truncated replay data")
+        mask = data[pos]
+        length, pos = _read_varint(data, pos + 1)
+        if mask > MAX_MASK or length < 1:
+            raise ReplayFormatError("Invalid run")
+        runs.append((mask, length))
+    if pos != len(data):
+        raise ReplayFormatError("Trailing bytes after replay data")
+    if sum(length for _, length in runs) != frame_count:
+        raise ReplayFormatError("Frame count mismatch")
+    return {"frame_rate": frame_rate, "frame_count": frame_count, "runs": runs}
+
+
+class ReplayCache:
+    """Small LRU of decoded ghosts keyed by score id.
+
+    Leaderboard ghosts are requested far more often than any other replay, so
+    keeping the most recently used ones decoded saves a database round trip
+    and a decode per request.
+    """
+
+    def __init__(self, maxsize: int = 50):
+        self.maxsize = maxsize
+        self._entries: "OrderedDict[str, dict]" = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, score_id: str) -> Optional[dict]:
+        entry = self._entries.get(score_id)
+        if entry is None:
+            self.misses += 1
+            return None
+        self._entries.move_to_end(score_id)
+        self.hits += 1
+        return entry
+
+    def put(self, score_id: str, ghost: dict):
+        self._entries[score_id] = ghost
+        self._entries.move_to_end(score_id)
+        while len(self._entries) > self.maxsize:
+            self._entries.popitem(last=False)
+
+    def invalidate(self, score_id: str):
+        self._entries.pop(score_id, None)
@@ -1,30 +1,99 @@
-from fastapi import FastAPI, APIRouter, HTTPException, Depends
+from fastapi import FastAPI, APIRouter, HTTPException, Depends, Header, BackgroundTasks, Query, Request
+from fastapi.responses import PlainTextResponse
 from dotenv import load_dotenv
 from starlette.middleware.cors import CORSMiddleware
-from motor.motor_asyncio import AsyncIOMotorClient
+from contextlib import asynccontextmanager, suppress
+import asyncio
 import os
 import logging
 from pathlib import Path
 from pydantic import BaseModel, Field
-from typing import List, Optional
+from typing import List, Optional, Tuple
 import uuid
 from datetime import datetime
 import hashlib
+import hmac
+
+from export_collections import EXPORT_COLLECTIONS
+from storage import create_storage
+from loader import BatchLoader, LoaderScopeMiddleware
+from profiling import ProfiledDatabase, ProfiledRoute, Profiler, ProfilingMiddleware, timed
+from replay import ReplayCache, ReplayFormatError, decode_replay, encode_replay, frames_to_runs
+from telemetry import PayloadTooLarge, TelemetryBuffer, TelemetryError, build_documents, decode_payload, read_body
 
 
 ROOT_DIR = Path(__file__).parent
-load_dotenv(ROOT_DIR / '.env')
 
-# MongoDB connection
-mongo_url = os.environ['MONGO_URL']
-client = AsyncIOMotorClient(mongo_url)
-db = client[os.environ['DB_NAME']]
+logger = logging.getLogger(__name__)
+
+class Services:
+    """Runtime services of one app, kept on ``app.state.services``.
+
+    Nothing here does I/O when constructed: the storage backend and friends
+    are built in the app lifespan (see init), so the module can be imported by
+    tools and tests without a database, and each create_app() gets its own.
+    """
+
+    def __init__(self):
+        self.storage = None  # MongoStorage or SQLiteStorage, see storage.py
+        self.db = None  # storage, wrapped for request profiling
+        self.telemetry_buffer: Optional[TelemetryBuffer] = None
+        self.replay_cache: Optional[ReplayCache] = None
+        self.user_loader: Optional[BatchLoader] = None
+        self.export_dir: Optional[Path] = None
+        # Held while an export runs; exports share the watermark file
+        self.export_lock = asyncio.Lock()
+        # Request profiling is off until enabled through the environment or admin API
+        self.profiler = Profiler()
+
+    def init(self):
+        """Read settings and build the storage backend and in-process services."""
+        load_dotenv(ROOT_DIR / '.env')
+
+        # MongoDB, or SQLite for single-node installs (STORAGE_BACKEND)
+        self.storage = create_storage()
+        self.db = ProfiledDatabase(self.storage)
+
+        self.profiler.configure(
+            enabled=os.environ.get('PROFILING_ENABLED', '').lower() in ('1', 'true', 'yes'),
+            sample_rate=float(os.environ.get('PROFILING_SAMPLE_RATE', 0.01)),
+            route=os.environ.get('PROFILING_ROUTE', ''),
+            slow_ms=float(os.environ.get('PROFILING_SLOW_MS', 500)),
+            buffer_size=int(os.environ.get('PROFILING_BUFFER_SIZE', 100))
+        )
+
+        self.export_dir = Path(os.environ.get('EXPORT_DIR', ROOT_DIR / 'exports'))
+
+        # Gameplay events are buffered in memory and written in bulk
+        self.telemetry_buffer = TelemetryBuffer(
+            self.storage.game_events,
+            capacity=int(os.environ.get('TELEMETRY_BUFFER_CAPACITY', 100_000)),
+            flush_size=int(os.environ.get('TELEMETRY_FLUSH_SIZE', 2000)),
+            flush_interval=float(os.environ.get('TELEMETRY_FLUSH_INTERVAL', 1.0))
+        )
+
+        # Coalesces get_user_by_id calls issued in the same event-loop tick.
+        # Batches serve several requests, so the unprofiled repository is
+        # used and each caller times its own wait (see get_user_by_id).
+        self.user_loader = BatchLoader(
+            self.storage.users.get_many_by_id,
+            negative_ttl=float(os.environ.get('USER_LOADER_NEGATIVE_TTL', 1.0))
+        )
+
+        # Decoded ghosts of the most requested (leaderboard) replays
+        self.replay_cache = ReplayCache(maxsize=int(os.environ.get('REPLAY_CACHE_SIZE', 50)))
+
+    async def ensure_indexes(self):
+        try:
+            await self.storage.ensure_indexes()
+        except Exception:
+            logger.exception("Failed to create indexes")
 
-# Create the main app without a prefix
-app = FastAPI()
+def get_services(request: Request) -> Services:
+    return request.app.state.services
 
 # Create a router with the /api prefix
-api_router = APIRouter(prefix="/api")
+api_router = APIRouter(prefix="/api", route_class=ProfiledRoute)
 
 
 # Define Models
@@ -102,6 +171,42 @@ class GameSession(BaseModel):
     expires_at: datetime
     is_active: bool = True
 
+class Replay(BaseModel):
+    id: str = Field(default_factory=lambda: str(uuid.uuid4()))
+    score_id: str
+    user_id: str
+    frame_rate: int
+    frame_count: int
+    size_bytes: int
+    created_at: datetime = Field(default_factory=datetime.utcnow)
+
+class ReplayCreate(BaseModel):
+    frame_rate: int = 60
+    frames: Optional[List[int]] = None  # one key bitmask per frame
+    runs: Optional[List[Tuple[int, int]]] = None  # or pre-collapsed (mask, length) runs
+
+class Ghost(BaseModel):
+    score_id: str
+    user_id: str
+    username: str
+    score: int
+    frame_rate: int
+    frame_count: int
+    runs: List[Tuple[int, int]]
+
+class ProfilingSettings(BaseModel):
+    enabled: Optional[bool] = None
+    sample_rate: Optional[float] = Field(None, ge=0, le=1)
+    route: Optional[str] = None  # e.g. "/api/stats/global", "" clears the filter
+    slow_ms: Optional[float] = Field(None, ge=0)
+    buffer_size: Optional[int] = Field(None, ge=0)
+
+class ExportRequest(BaseModel):
+    collections: List[str] = EXPORT_COLLECTIONS
+    incremental: bool = True
+    since: Optional[datetime] = None
+    format: str = "parquet"
+
 # Helper functions
 def hash_password(password: str) -> str:
     return hashlib.sha256(password.encode()).hexdigest()
@@ -109,35 +214,23 @@ def hash_password(password: str) -> str:
 def verify_password(password: str, hashed: str) -> bool:
     return hash_password(password) == hashed
 
-async def get_user_by_id(user_id: str) -> Optional[User]:
-    user_data = await db.users.find_one({"id": user_id})
+async def get_user_by_id(services: Services, user_id: str) -> Optional[User]:
+    # Batched with concurrent lookups into one get_many_by_id call
+    user_data = await timed("db:users.load", services.user_loader.load(user_id))
     if user_data:
         return User(**user_data)
     return None
 
-async def get_user_by_username(username: str) -> Optional[User]:
-    user_data = await db.users.find_one({"username": username})
+async def get_user_by_username(services: Services, username: str) -> Optional[User]:
+    user_data = await services.db.users.get_by_username(username)
     if user_data:
         return User(**user_data)
     return None
 
-# Include the router in the main app
-app.include_router(api_router)
-
-app.add_middleware(
-    CORSMiddleware,
-    allow_credentials=True,
-    allow_origins=["*"],
-    allow_methods=["*"],
-    allow_headers=["*"],
-)
-
-# Configure logging
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
-)
-logger = logging.getLogger(__name__)
+def require_admin(x_admin_token: Optional[str] = Header(None)):
+    admin_token = os.environ.get('ADMIN_TOKEN')
+    if not admin_token or not hmac.compare_digest((x_admin_token or "").encode(), admin_token.encode()):
+        raise HTTPException(status_code=403, detail="Admin access required")
 
 # Add your routes to the router instead of directly to app
 @api_router.get("/")
@@ -146,9 +239,9 @@ async def root():
 
 # User Authentication Routes
 @api_router.post("/users", response_model=UserResponse)
-async def create_user(user_data: UserCreate):
+async def create_user(user_data: UserCreate, services: Services = Depends(get_services)):
     # Check if username already exists
-    existing_user = await get_user_by_username(user_data.username)
+    existing_user = await get_user_by_username(services, user_data.username)
     if existing_user:
         raise HTTPException(status_code=400, detail="Username already exists")
     
@@ -158,13 +251,14 @@ async def create_user(user_data: UserCreate):
     user_obj = User(**user_dict)
     
     # Insert to database
-    await db.users.insert_one(user_obj.dict())
+    await services.db.users.insert(user_obj.dict())
+    services.user_loader.clear(user_obj.id)
     
     return UserResponse(**user_obj.dict())
 
 @api_router.post("/auth/login")
-async def login_user(login_data: UserLogin):
-    user = await get_user_by_username(login_data.username)
+async def login_user(login_data: UserLogin, services: Services = Depends(get_services)):
+    user = await get_user_by_username(services, login_data.username)
     if not user or not verify_password(login_data.password, user.password_hash):
         raise HTTPException(status_code=401, detail="Invalid credentials")
     
@@ -178,7 +272,7 @@ async def login_user(login_data: UserLogin):
         expires_at=expires_at
     )
     
-    await db.game_sessions.insert_one(session.dict())
+    await services.db.game_sessions.insert(session.dict())
     
     return {
         "message": "Login successful",
@@ -187,23 +281,23 @@ async def login_user(login_data: UserLogin):
     }
 
 @api_router.get("/users/{user_id}", response_model=UserResponse)
-async def get_user(user_id: str):
-    user = await get_user_by_id(user_id)
+async def get_user(user_id: str, services: Services = Depends(get_services)):
+    user = await get_user_by_id(services, user_id)
     if not user:
         raise HTTPException(status_code=404, detail="User not found")
     return UserResponse(**user.dict())
 
 # Score Management Routes
 @api_router.post("/scores", response_model=Score)
-async def create_score(score_data: ScoreCreate):
+async def create_score(score_data: ScoreCreate, services: Services = Depends(get_services)):
     # Verify user exists
-    user = await get_user_by_id(score_data.user_id)
+    user = await get_user_by_id(services, score_data.user_id)
     if not user:
         raise HTTPException(status_code=404, detail="User not found")
     
     # Create score record
     score_obj = Score(**score_data.dict())
-    await db.scores.insert_one(score_obj.dict())
+    await services.db.scores.insert(score_obj.dict())
     
     # Update user's high score and stats
     update_data = {}
@@ -215,89 +309,160 @@ async def create_score(score_data: ScoreCreate):
         update_data["levels_completed"] = score_data.level_reached
     
     if update_data:
-        await db.users.update_one(
-            {"id": score_data.user_id},
-            {"$set": update_data}
-        )
+        await services.db.users.update(score_data.user_id, update_data)
+        services.user_loader.clear(score_data.user_id)
     
     return score_obj
 
 @api_router.get("/scores", response_model=List[Score])
-async def get_leaderboard(limit: int = 10):
-    scores = await db.scores.find().sort("score", -1).limit(limit).to_list(limit)
+async def get_leaderboard(limit: int = 10, services: Services = Depends(get_services)):
+    scores = await services.db.scores.top(limit)
     return [Score(**score) for score in scores]
 
 @api_router.get("/scores/user/{user_id}", response_model=List[Score])
-async def get_user_scores(user_id: str, limit: int = 10):
-    scores = await db.scores.find({"user_id": user_id}).sort("score", -1).limit(limit).to_list(limit)
+async def get_user_scores(user_id: str, limit: int = 10, services: Services = Depends(get_services)):
+    scores = await services.db.scores.for_user(user_id, limit)
     return [Score(**score) for score in scores]
 
+# Replay Routes
+# Ghosts per /replays/top call, kept within the default REPLAY_CACHE_SIZE so a
+# large request can't flush the leaderboard ghosts out of the cache
+MAX_TOP_GHOSTS = 50
+
+def build_ghost(score: dict, replay_doc: dict) -> Ghost:
+    decoded = decode_replay(replay_doc["data"])
+    return Ghost(
+        score_id=score["id"],
+        user_id=score["user_id"],
+        username=score["username"],
+        score=score["score"],
+        **decoded
+    )
+
+@api_router.post("/scores/{score_id}/replay", response_model=Replay)
+async def upload_replay(score_id: str, replay_data: ReplayCreate, services: Services = Depends(get_services)):
+    score = await services.db.scores.get(score_id)
+    if not score:
+        raise HTTPException(status_code=404, detail="Score not found")
+    if (replay_data.frames is None) == (replay_data.runs is None):
+        raise HTTPException(status_code=400, detail="Provide exactly one of frames or runs")
+
+    runs = replay_data.runs if replay_data.runs is not None else frames_to_runs(replay_data.frames)
+    try:
+        data = encode_replay(runs, replay_data.frame_rate)
+    except ReplayFormatError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    replay_obj = Replay(
+        score_id=score_id,
+        user_id=score["user_id"],
+        frame_rate=replay_data.frame_rate,
+        frame_count=sum(length for _, length in runs),
+        size_bytes=len(data)
+    )
+    await services.db.replays.save({**replay_obj.dict(), "data": data})
+    services.replay_cache.invalidate(score_id)
+
+    return replay_obj
+
+@api_router.get("/scores/{score_id}/replay", response_model=Ghost)
+async def get_replay(score_id: str, services: Services = Depends(get_services)):
+    ghost = services.replay_cache.get(score_id)
+    if ghost:
+        return ghost
+
+    score = await services.db.scores.get(score_id)
+    replay_doc = await services.db.replays.get(score_id)
+    if not score or not replay_doc:
+        raise HTTPException(status_code=404, detail="Replay not found")
+
+    ghost = build_ghost(score, replay_doc)
+    services.replay_cache.put(score_id, ghost)
+    return ghost
+
+@api_router.get("/replays/top", response_model=List[Ghost])
+async def get_top_ghosts(limit: int = Query(10, ge=1, le=MAX_TOP_GHOSTS), services: Services = Depends(get_services)):
+    scores = await services.db.scores.top(limit)
+
+    ghosts = {}
+    missing = []
+    for score in scores:
+        ghost = services.replay_cache.get(score["id"])
+        if ghost:
+            ghosts[score["id"]] = ghost
+        else:
+            missing.append(score)
+
+    if missing:
+        replay_docs = await services.db.replays.get_many([score["id"] for score in missing])
+        replays_by_score = {doc["score_id"]: doc for doc in replay_docs}
+        for score in missing:
+            replay_doc = replays_by_score.get(score["id"])
+            if replay_doc:
+                ghost = build_ghost(score, replay_doc)
+                services.replay_cache.put(score["id"], ghost)
+                ghosts[score["id"]] = ghost
+
+    return [ghosts[score["id"]] for score in scores if score["id"] in ghosts]
+
 # Game Progress Routes
 @api_router.post("/progress", response_model=GameProgress)
-async def save_game_progress(progress_data: GameProgressCreate):
+async def save_game_progress(progress_data: GameProgressCreate, services: Services = Depends(get_services)):
     # Verify user exists
-    user = await get_user_by_id(progress_data.user_id)
+    user = await get_user_by_id(services, progress_data.user_id)
     if not user:
         raise HTTPException(status_code=404, detail="User not found")
     
     # Check if progress already exists
-    existing_progress = await db.game_progress.find_one({"user_id": progress_data.user_id})
+    existing_progress = await services.db.game_progress.get(progress_data.user_id)
     
     if existing_progress:
         # Update existing progress
         progress_dict = progress_data.dict()
         progress_dict["updated_at"] = datetime.utcnow()
-        await db.game_progress.update_one(
-            {"user_id": progress_data.user_id},
-            {"$set": progress_dict}
-        )
+        await services.db.game_progress.update(progress_data.user_id, progress_dict)
         progress_obj = GameProgress(**{**existing_progress, **progress_dict})
     else:
         # Create new progress
         progress_obj = GameProgress(**progress_data.dict())
-        await db.game_progress.insert_one(progress_obj.dict())
+        await services.db.game_progress.insert(progress_obj.dict())
     
     return progress_obj
 
 @api_router.get("/progress/{user_id}", response_model=GameProgress)
-async def get_game_progress(user_id: str):
-    progress_data = await db.game_progress.find_one({"user_id": user_id})
+async def get_game_progress(user_id: str, services: Services = Depends(get_services)):
+    progress_data = await services.db.game_progress.get(user_id)
     if not progress_data:
         raise HTTPException(status_code=404, detail="No progress found for user")
     return GameProgress(**progress_data)
 
 @api_router.delete("/progress/{user_id}")
-async def delete_game_progress(user_id: str):
-    result = await db.game_progress.delete_one({"user_id": user_id})
-    if result.deleted_count == 0:
+async def delete_game_progress(user_id: str, services: Services = Depends(get_services)):
+    deleted = await services.db.game_progress.delete(user_id)
+    if not deleted:
         raise HTTPException(status_code=404, detail="No progress found for user")
     return {"message": "Progress deleted successfully"}
 
 # Game Statistics Routes
 @api_router.get("/stats/global")
-async def get_global_stats():
+async def get_global_stats(services: Services = Depends(get_services)):
     # Get total users
-    total_users = await db.users.count_documents({})
+    total_users = await services.db.users.count()
     
     # Get total games played
-    total_games = await db.scores.count_documents({})
+    total_games = await services.db.scores.count()
     
     # Get highest score
-    highest_score_doc = await db.scores.find_one({}, sort=[("score", -1)])
+    highest_score_doc = await services.db.scores.highest()
     highest_score = highest_score_doc["score"] if highest_score_doc else 0
     
     # Get most active player
-    pipeline = [
-        {"$group": {"_id": "$user_id", "games_played": {"$sum": 1}}},
-        {"$sort": {"games_played": -1}},
-        {"$limit": 1}
-    ]
-    most_active = await db.scores.aggregate(pipeline).to_list(1)
+    most_active = await services.db.scores.most_active(1)
     
     most_active_user = None
     if most_active:
-        user_id = most_active[0]["_id"]
-        user = await get_user_by_id(user_id)
+        user_id = most_active[0]["user_id"]
+        user = await get_user_by_id(services, user_id)
         if user:
             most_active_user = {
                 "username": user.username,
@@ -311,10 +476,146 @@ async def get_global_stats():
         "most_active_user": most_active_user
     }
 
+# Telemetry Routes
+@api_router.post("/telemetry", status_code=202)
+async def ingest_telemetry(request: Request, services: Services = Depends(get_services)):
+    try:
+        body = await read_body(request.stream(), request.headers.get("content-length"))
+        payload = decode_payload(body, request.headers.get("content-encoding"))
+        documents = build_documents(payload)
+    except PayloadTooLarge as e:
+        raise HTTPException(status_code=413, detail=str(e))
+    except TelemetryError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    if not services.telemetry_buffer.append(documents):
+        raise HTTPException(
+            status_code=503,
+            detail="Telemetry buffer full, retry later",
+            headers={"Retry-After": str(max(1, int(services.telemetry_buffer.flush_interval)))}
+        )
+    return {"accepted": len(documents)}
+
+# Admin Routes
+@api_router.post("/admin/export", status_code=202, dependencies=[Depends(require_admin)])
+async def export_analytics(export_request: ExportRequest, background_tasks: BackgroundTasks,
+                           services: Services = Depends(get_services)):
+    # pandas/pyarrow are only needed here, keep them out of startup
+    from export import run_export
+
+    unknown = set(export_request.collections) - set(EXPORT_COLLECTIONS)
+    if unknown:
+        raise HTTPException(status_code=400, detail=f"Unknown collections: {', '.join(sorted(unknown))}")
+    if export_request.format not in ("parquet", "arrow"):
+        raise HTTPException(status_code=400, detail="Format must be 'parquet' or 'arrow'")
+    if services.storage.name != "mongo":
+        raise HTTPException(status_code=400, detail="Analytics export requires the mongo storage backend")
+    if services.export_lock.locked():
+        raise HTTPException(status_code=409, detail="An export is already running")
+    # Not contended (checked above), so this returns without yielding
+    await services.export_lock.acquire()
+
+    async def export_job():
+        try:
+            results = await run_export(
+                services.storage.db,
+                services.export_dir,
+                collections=export_request.collections,
+                incremental=export_request.incremental,
+                since=export_request.since,
+                fmt=export_request.format
+            )
+        finally:
+            services.export_lock.release()
+        for result in results:
+            logger.info(f"Exported {result['rows']} {result['collection']} rows to {services.export_dir}")
+
+    background_tasks.add_task(export_job)
+    return {"message": "Export started", "collections": export_request.collections, "output_dir": str(services.export_dir)}
+
+@api_router.get("/admin/telemetry", dependencies=[Depends(require_admin)])
+async def telemetry_stats(services: Services = Depends(get_services)):
+    return services.telemetry_buffer.stats()
+
+@api_router.get("/admin/loaders", dependencies=[Depends(require_admin)])
+async def loader_stats(services: Services = Depends(get_services)):
+    return {"users": services.user_loader.stats()}
+
+@api_router.get("/admin/profiling", dependencies=[Depends(require_admin)])
+async def get_profiling_settings(services: Services = Depends(get_services)):
+    return services.profiler.settings()
+
+@api_router.put("/admin/profiling", dependencies=[Depends(require_admin)])
+async def update_profiling_settings(settings: ProfilingSettings, services: Services = Depends(get_services)):
+    try:
+        services.profiler.configure(**settings.dict())
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return services.profiler.settings()
+
+@api_router.get("/admin/profiling/slow", dependencies=[Depends(require_admin)])
+async def get_slow_requests(format: str = "json", services: Services = Depends(get_services)):
+    if format == "folded":
+        return PlainTextResponse(services.profiler.folded())
+    if format != "json":
+        raise HTTPException(status_code=400, detail="Format must be 'json' or 'folded'")
+    return [profile.to_dict() for profile in services.profiler.slow_requests]
+
+@api_router.delete("/admin/profiling/slow", dependencies=[Depends(require_admin)])
+async def clear_slow_requests(services: Services = Depends(get_services)):
+    services.profiler.slow_requests.clear()
+    return {"message": "Slow request buffer cleared"}
+
 # Health check route
 @api_router.get("/health")
 async def health_check():
     return {"status": "healthy", "timestamp": datetime.utcnow()}
-@app.on_event("shutdown")
-async def shutdown_db_client():
-    client.close()
+
+# Application setup
+def configure_logging():
+    logging.basicConfig(
+        level=logging.INFO,
+        format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+    )
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    services = app.state.services
+    configure_logging()
+    services.init()
+    # Don't hold up the first request on index builds
+    index_task = asyncio.create_task(services.ensure_indexes())
+    services.telemetry_buffer.start()
+    try:
+        yield
+    finally:
+        index_task.cancel()
+        with suppress(asyncio.CancelledError):
+            await index_task
+        await services.telemetry_buffer.stop()
+        await services.storage.close()
+
+def create_app() -> FastAPI:
+    # Create the main app without a prefix
+    app = FastAPI(lifespan=lifespan)
+    app.state.services = Services()
+
+    # Include the router in the main app
+    app.include_router(api_router)
+
+    app.add_middleware(
+        CORSMiddleware,
+        allow_credentials=True,
+        allow_origins=["*"],
+        allow_methods=["*"],
+        allow_headers=["*"],
+    )
+
+    app.add_middleware(LoaderScopeMiddleware)
+
+    app.add_middleware(ProfilingMiddleware, profiler=app.state.services.profiler)
+    return app
+
+# Cheap to build: all I/O happens in the lifespan. Also available as
+# `uvicorn --factory server:create_app`.
+app = create_app()
@@ -0,0 +1,154 @@
+"""Storage backends behind the API.
+
+Route handlers talk to a storage object exposing one repository per
+collection (``users``, ``scores``, ``game_progress``, ``game_sessions``,
+``replays``, ``game_events``). Repositories take and return plain dicts shaped
+like the pydantic models in server.py, so handlers don't know which backend
+they run on.
+
+``STORAGE_BACKEND`` selects the implementation:
+
+* ``mongo`` (default) -- MongoStorage, over Motor
+* ``sqlite``          -- SQLiteStorage (storage_sqlite.py), an embedded
+                         database for single-node installs
+"""
+import os
+from pathlib import Path
+from typing import List, Optional
+
+from export_collections import EXPORT_TIMESTAMP_FIELDS
+
+
+class MongoUserRepository:
+    def __init__(self, collection):
+        self.collection = collection
+
+    async def get_by_id(self, user_id: str) -> Optional[dict]:
+        return await self.collection.find_one({"id": user_id})
+
+    async def get_many_by_id(self, user_ids: List[str]) -> List[dict]:
+        return await self.collection.find({"id": {"$in": user_ids}}).to_list(len(user_ids))
+
+    async def get_by_username(self, username: str) -> Optional[dict]:
+        return await self.collection.find_one({"username": username})
+
+    async def insert(self, user: dict):
+        await self.collection.insert_one(user)
+
+    async def update(self, user_id: str, fields: dict):
+        await self.collection.update_one({"id": user_id}, {"$set": fields})
+
+    async def count(self) -> int:
+        return await self.collection.count_documents({})
+
+
+class MongoScoreRepository:
+    def __init__(self, collection):
+        self.collection = collection
+
+    async def get(self, score_id: str) -> Optional[dict]:
+        return await self.collection.find_one({"id": score_id})
+
+    async def insert(self, score: dict):
+        await self.collection.insert_one(score)
+
+    async def top(self, limit: int) -> List[dict]:
+        return await self.collection.find().sort("score", -1).limit(limit).to_list(limit)
+
+    async def for_user(self, user_id: str, limit: int) -> List[dict]:
+        return await self.collection.find({"user_id": user_id}).sort("score", -1).limit(limit).to_list(limit)
+
+    async def highest(self) -> Optional[dict]:
+        return await self.collection.find_one({}, sort=[("score", -1)])
+
+    async def most_active(self, limit: int = 1) -> List[dict]:
+        """Users with the most games, as ``{"user_id", "games_played"}`` dicts."""
+        pipeline = [
+            {"$group": {"_id": "$user_id", "games_played": {"$sum": 1}}},
+            {"$sort": {"games_played": -1}},
+            {"$limit": limit}
+        ]
+        rows = await self.collection.aggregate(pipeline).to_list(limit)
+        return [{"user_id": row["_id"], "games_played": row["games_played"]} for row in rows]
+
+    async def count(self) -> int:
+        return await self.collection.count_documents({})
+
+
+class MongoProgressRepository:
+    def __init__(self, collection):
+        self.collection = collection
+
+    async def get(self, user_id: str) -> Optional[dict]:
+        return await self.collection.find_one({"user_id": user_id})
+
+    async def insert(self, progress: dict):
+        await self.collection.insert_one(progress)
+
+    async def update(self, user_id: str, fields: dict):
+        await self.collection.update_one({"user_id": user_id}, {"$set": fields})
+
+    async def delete(self, user_id: str) -> bool:
+        result = await self.collection.delete_one({"user_id": user_id})
+        return result.deleted_count > 0
+
+
+class MongoSessionRepository:
+    def __init__(self, collection):
+        self.collection = collection
+
+    async def insert(self, session: dict):
+        await self.collection.insert_one(session)
+
+
+class MongoReplayRepository:
+    def __init__(self, collection):
+        self.collection = collection
+
+    async def get(self, score_id: str) -> Optional[dict]:
+        return await self.collection.find_one({"score_id": score_id})
+
+    async def get_many(self, score_ids: List[str]) -> List[dict]:
+        return await self.collection.find({"score_id": {"$in": score_ids}}).to_list(len(score_ids))
+
+    async def save(self, replay: dict):
+        await self.collection.replace_one({"score_id": replay["score_id"]}, replay, upsert=True)
+
+
+class MongoStorage:
+    name = "mongo"
+
+    def __init__(self, client, db):
+        self.client = client
+        self.db = db
+        self.users = MongoUserRepository(db.users)
+        self.scores = MongoScoreRepository(db.scores)
+        self.game_progress = MongoProgressRepository(db.game_progress)
+        self.game_sessions = MongoSessionRepository(db.game_sessions)
+        self.replays = MongoReplayRepository(db.replays)
+        # Only needs insert_many(), which the collection already has
+        self.game_events = db.game_events
+
+    async def ensure_indexes(self):
+        await self.db.replays.create_index("score_id", unique=True)
+        # Incremental exports range-scan and sort on these
+        for collection, timestamp_field in EXPORT_TIMESTAMP_FIELDS.items():
+            await self.db[collection].create_index(timestamp_field)
+
+    async def close(self):
+        self.client.close()
+
+
+def create_storage():
+    """Build the storage backend selected by ``STORAGE_BACKEND``."""
+    backend = os.environ.get('STORAGE_BACKEND', 'mongo').lower()
+    if backend == 'mongo':
+        from motor.motor_asyncio import AsyncIOMotorClient
+
+        client = AsyncIOMotorClient(os.environ['MONGO_URL'])
+        return MongoStorage(client, client[os.environ['DB_NAME']])
+    if backend == 'sqlite':
+        from storage_sqlite import SQLiteStorage
+
+        return SQLiteStorage(os.environ.get('SQLITE_PATH', Path(__file__).parent / 'game.db'))
+    raise ValueError(f"Unknown STORAGE_BACKEND: {backend}")
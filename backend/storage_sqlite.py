@@ -0,0 +1,384 @@
+"""Embedded SQLite storage backend for single-node deployments.
+
+Mirrors the Mongo repositories in storage.py on top of one SQLite file in WAL
+mode. All statements run on a single dedicated thread: SQLite serialises
+writers anyway, and this keeps blocking disk I/O off the event loop without
+connection pooling. The connection and schema are created lazily on first
+use.
+
+Values are converted by column name when rows are read (see
+``DATETIME_COLUMNS`` etc.) rather than with sqlite3's process-wide adapters
+and converters, which would change how every other connection in the
+process decodes those declared types.
+"""
+import asyncio
+import json
+import sqlite3
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from typing import List, Optional
+
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS users (
+    id TEXT PRIMARY KEY,
+    username TEXT NOT NULL,
+    email TEXT,
+    password_hash TEXT NOT NULL,
+    created_at DATETIME NOT NULL,
+    high_score INTEGER NOT NULL DEFAULT 0,
+    total_coins INTEGER NOT NULL DEFAULT 0,
+    levels_completed INTEGER NOT NULL DEFAULT 0
+);
+CREATE INDEX IF NOT EXISTS users_username ON users (username);
+
+CREATE TABLE IF NOT EXISTS scores (
+    id TEXT PRIMARY KEY,
+    user_id TEXT NOT NULL,
+    username TEXT NOT NULL,
+    score INTEGER NOT NULL,
+    level_reached INTEGER NOT NULL,
+    coins_collected INTEGER NOT NULL,
+    game_duration INTEGER NOT NULL,
+    created_at DATETIME NOT NULL
+);
+CREATE INDEX IF NOT EXISTS scores_score ON scores (score DESC);
+CREATE INDEX IF NOT EXISTS scores_user_score ON scores (user_id, score DESC);
+
+CREATE TABLE IF NOT EXISTS game_progress (
+    id TEXT PRIMARY KEY,
+    user_id TEXT NOT NULL,
+    current_level INTEGER NOT NULL,
+    lives_remaining INTEGER NOT NULL,
+    score INTEGER NOT NULL,
+    coins INTEGER NOT NULL,
+    power_ups JSON NOT NULL,
+    last_checkpoint JSON NOT NULL,
+    updated_at DATETIME NOT NULL
+);
+CREATE INDEX IF NOT EXISTS game_progress_user ON game_progress (user_id);
+
+CREATE TABLE IF NOT EXISTS game_sessions (
+    id TEXT PRIMARY KEY,
+    user_id TEXT NOT NULL,
+    session_token TEXT NOT NULL,
+    created_at DATETIME NOT NULL,
+    expires_at DATETIME NOT NULL,
+    is_active BOOLEAN NOT NULL
+);
+CREATE INDEX IF NOT EXISTS game_sessions_token ON game_sessions (session_token);
+CREATE INDEX IF NOT EXISTS game_sessions_user ON game_sessions (user_id);
+
+CREATE TABLE IF NOT EXISTS replays (
+    score_id TEXT PRIMARY KEY,
+    id TEXT NOT NULL,
+    user_id TEXT NOT NULL,
+    frame_rate INTEGER NOT NULL,
+    frame_count INTEGER NOT NULL,
+    size_bytes INTEGER NOT NULL,
+    created_at DATETIME NOT NULL,
+    data BLOB NOT NULL
+);
+
+CREATE TABLE IF NOT EXISTS game_events (
+    seq INTEGER PRIMARY KEY AUTOINCREMENT,
+    run_id TEXT NOT NULL,
+    user_id TEXT,
+    type TEXT NOT NULL,
+    received_at DATETIME NOT NULL,
+    payload JSON NOT NULL
+);
+CREATE INDEX IF NOT EXISTS game_events_run ON game_events (run_id);
+"""
+
+JSON_COLUMNS = {"power_ups", "last_checkpoint", "payload"}
+DATETIME_COLUMNS = {"created_at", "updated_at", "expires_at", "received_at"}
+BOOLEAN_COLUMNS = {"is_active"}
+
+
+def _adapt(params):
+    """Statement parameters as SQLite stores them (datetimes as ISO 8601 text)."""
+    if isinstance(params, dict):
+        return {key: value.isoformat() if isinstance(value, datetime) else value for key, value in params.items()}
+    return [value.isoformat() if isinstance(value, datetime) else value for value in params]
+
+
+def _convert(row: sqlite3.Row) -> dict:
+    document = dict(row)
+    for column, value in document.items():
+        if value is None:
+            continue
+        if column in DATETIME_COLUMNS:
+            document[column] = datetime.fromisoformat(value)
+        elif column in JSON_COLUMNS:
+            document[column] = json.loads(value)
+        elif column in BOOLEAN_COLUMNS:
+            document[column] = bool(value)
+    return document
+
+
+class SQLiteDatabase:
+    def __init__(self, path):
+        self.path = str(path)
+        self._connection: Optional[sqlite3.Connection] = None
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="sqlite")
+
+    def _connect(self) -> sqlite3.Connection:
+        if self._connection is None:
+            connection = sqlite3.connect(
+                self.path,
+                isolation_level=None,
+                check_same_thread=False
+            )
+            connection.row_factory = sqlite3.Row
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.execute("PRAGMA synchronous=NORMAL")
+            connection.execute("PRAGMA busy_timeout=5000")
+            connection.execute("PRAGMA temp_store=MEMORY")
+            connection.executescript(SCHEMA)
+            self._connection = connection
+        return self._connection
+
+    async def _run(self, fn, *args):
+        return await asyncio.get_running_loop().run_in_executor(self._executor, fn, *args)
+
+    async def fetchone(self, sql: str, params=()) -> Optional[dict]:
+        def query():
+            row = self._connect().execute(sql, _adapt(params)).fetchone()
+            return _convert(row) if row is not None else None
+        return await self._run(query)
+
+    async def fetchall(self, sql: str, params=()) -> List[dict]:
+        def query():
+            return [_convert(row) for row in self._connect().execute(sql, _adapt(params)).fetchall()]
+        return await self._run(query)
+
+    async def execute(self, sql: str, params=()) -> int:
+        def statement():
+            return self._connect().execute(sql, _adapt(params)).rowcount
+        return await self._run(statement)
+
+    async def executemany(self, sql: str, rows: List[tuple]):
+        def statements():
+            connection = self._connect()
+            connection.execute("BEGIN")
+            try:
+                connection.executemany(sql, [_adapt(row) for row in rows])
+            except BaseException:
+                connection.execute("ROLLBACK")
+                raise
+            connection.execute("COMMIT")
+        await self._run(statements)
+
+    async def connect(self):
+        await self._run(self._connect)
+
+    async def close(self):
+        def close():
+            if self._connection is not None:
+                self._connection.close()
+                self._connection = None
+        await self._run(close)
+        self._executor.shutdown(wait=True)
+
+
+def _encode(value, column: str):
+    if column in JSON_COLUMNS:
+        return json.dumps(value, default=str)
+    return value
+
+
+class SQLiteTable:
+    """Insert/update helpers shared by the repositories of one table."""
+
+    def __init__(self, database: SQLiteDatabase, table: str, columns: List[str]):
+        self.database = database
+        self.table = table
+        self.columns = columns
+        placeholders = ", ".join("?" * len(columns))
+        self._insert_sql = f"INSERT INTO {table} ({', '.join(columns)}) VALUES ({placeholders})"
+        self._replace_sql = f"INSERT OR REPLACE INTO {table} ({', '.join(columns)}) VALUES ({placeholders})"
+
+    def row(self, document: dict) -> tuple:
+        return tuple(_encode(document.get(column), column) for column in self.columns)
+
+    async def insert(self, document: dict):
+        await self.database.execute(self._insert_sql, self.row(document))
+
+    async def replace(self, document: dict):
+        await self.database.execute(self._replace_sql, self.row(document))
+
+    async def update(self, key: str, value, fields: dict) -> int:
+        unknown = set(fields) - set(self.columns)
+        if unknown:
+            raise ValueError(f"Unknown {self.table} columns: {', '.join(sorted(unknown))}")
+        if not fields:
+            return 0
+        assignments = ", ".join(f"{column} = ?" for column in fields)
+        params = [_encode(v, column) for column, v in fields.items()] + [value]
+        return await self.database.execute(f"UPDATE {self.table} SET {assignments} WHERE {key} = ?", params)
+
+
+class SQLiteUserRepository:
+    def __init__(self, database: SQLiteDatabase):
+        self.database = database
+        self.table = SQLiteTable(database, "users", [
+            "id", "username", "email", "password_hash", "created_at", "high_score", "total_coins", "levels_completed"
+        ])
+
+    async def get_by_id(self, user_id: str) -> Optional[dict]:
+        return await self.database.fetchone("SELECT * FROM users WHERE id = ?", (user_id,))
+
+    async def get_many_by_id(self, user_ids: List[str]) -> List[dict]:
+        if not user_ids:
+            return []
+        placeholders = ", ".join("?" * len(user_ids))
+        return await self.database.fetchall(f"SELECT * FROM users WHERE id IN ({placeholders})", user_ids)
+
+    async def get_by_username(self, username: str) -> Optional[dict]:
+        return await self.database.fetchone("SELECT * FROM users WHERE username = ? LIMIT 1", (username,))
+
+    async def insert(self, user: dict):
+        await self.table.insert(user)
+
+    async def update(self, user_id: str, fields: dict):
+        await self.table.update("id", user_id, fields)
+
+    async def count(self) -> int:
+        row = await self.database.fetchone("SELECT COUNT(*) AS n FROM users")
+        return row["n"]
+
+
+class SQLiteScoreRepository:
+    def __init__(self, database: SQLiteDatabase):
+        self.database = database
+        self.table = SQLiteTable(database, "scores", [
+            "id", "user_id", "username", "score", "level_reached", "coins_collected", "game_duration", "created_at"
+        ])
+
+    async def get(self, score_id: str) -> Optional[dict]:
+        return await self.database.fetchone("SELECT * FROM scores WHERE id = ?", (score_id,))
+
+    async def insert(self, score: dict):
+        await self.table.insert(score)
+
+    async def top(self, limit: int) -> List[dict]:
+        return await self.database.fetchall("SELECT * FROM scores ORDER BY score DESC LIMIT ?", (limit,))
+
+    async def for_user(self, user_id: str, limit: int) -> List[dict]:
+        return await self.database.fetchall(
+            "SELECT * FROM scores WHERE user_id = ? ORDER BY score DESC LIMIT ?", (user_id, limit)
+        )
+
+    async def highest(self) -> Optional[dict]:
+        return await self.database.fetchone("SELECT * FROM scores ORDER BY score DESC LIMIT 1")
+
+    async def most_active(self, limit: int = 1) -> List[dict]:
+        return await self.database.fetchall(
+            "SELECT user_id, COUNT(*) AS games_played FROM scores GROUP BY user_id ORDER BY games_played DESC LIMIT ?",
+            (limit,)
+        )
+
+    async def count(self) -> int:
+        row = await self.database.fetchone("SELECT COUNT(*) AS n FROM scores")
+        return row["n"]
+
+
+class SQLiteProgressRepository:
+    def __init__(self, database: SQLiteDatabase):
+        self.database = database
+        self.table = SQLiteTable(database, "game_progress", [
+            "id", "user_id", "current_level", "lives_remaining", "score", "coins", "power_ups", "last_checkpoint", "updated_at"
+        ])
+
+    async def get(self, user_id: str) -> Optional[dict]:
+        return await self.database.fetchone("SELECT * FROM game_progress WHERE user_id = ? LIMIT 1", (user_id,))
+
+    async def insert(self, progress: dict):
+        await self.table.insert(progress)
+
+    async def update(self, user_id: str, fields: dict):
+        await self.table.update("user_id", user_id, fields)
+
+    async def delete(self, user_id: str) -> bool:
+        # Mongo's delete_one removes a single document
+        deleted = await self.database.execute(
+            "DELETE FROM game_progress WHERE rowid = (SELECT rowid FROM game_progress WHERE user_id = ? LIMIT 1)",
+            (user_id,)
+        )
+        return deleted > 0
+
+
+class SQLiteSessionRepository:
+    def __init__(self, database: SQLiteDatabase):
+        self.table = SQLiteTable(database, "game_sessions", [
+            "id", "user_id", "session_token", "created_at", "expires_at", "is_active"
+        ])
+
+    async def insert(self, session: dict):
+        await self.table.insert(session)
+
+
+class SQLiteReplayRepository:
+    def __init__(self, database: SQLiteDatabase):
+        self.database = database
+        self.table = SQLiteTable(database, "replays", [
+            "score_id", "id", "user_id", "frame_rate", "frame_count", "size_bytes", "created_at", "data"
+        ])
+
+    async def get(self, score_id: str) -> Optional[dict]:
+        return await self.database.fetchone("SELECT * FROM replays WHERE score_id = ?", (score_id,))
+
+    async def get_many(self, score_ids: List[str]) -> List[dict]:
+        if not score_ids:
+            return []
+        placeholders = ", ".join("?" * len(score_ids))
+        return await self.database.fetchall(f"SELECT * FROM replays WHERE score_id IN ({placeholders})", score_ids)
+
+    async def save(self, replay: dict):
+        # score_id is the primary key, so this replaces an earlier upload
+        await self.table.replace(replay)
+
+
+class SQLiteEventRepository:
+    """Telemetry sink with the ``insert_many`` signature TelemetryBuffer expects."""
+
+    COMMON_FIELDS = ("run_id", "user_id", "type", "received_at")
+
+    def __init__(self, database: SQLiteDatabase):
+        self.database = database
+
+    async def insert_many(self, documents: List[dict], ordered: bool = True):
+        rows = [
+            (
+                document["run_id"],
+                document.get("user_id"),
+                document["type"],
+                document["received_at"],
+                json.dumps({k: v for k, v in document.items() if k not in self.COMMON_FIELDS and k != "_id"}, default=str)
+            )
+            for document in documents
+        ]
+        await self.database.executemany(
+            "INSERT INTO game_events (run_id, user_id, type, received_at, payload) VALUES (?, ?, ?, ?, ?)", rows
+        )
+
+
+class SQLiteStorage:
+    name = "sqlite"
+
+    def __init__(self, path):
+        self.database = SQLiteDatabase(path)
+        self.users = SQLiteUserRepository(self.database)
+        self.scores = SQLiteScoreRepository(self.database)
+        self.game_progress = SQLiteProgressRepository(self.database)
+        self.game_sessions = SQLiteSessionRepository(self.database)
+        self.replays = SQLiteReplayRepository(self.database)
+        self.game_events = SQLiteEventRepository(self.database)
+
+    async def ensure_indexes(self):
+        # Tables and indexes are created together with the connection
+        await self.database.connect()
+
+    async def close(self):
+        await self.database.close()
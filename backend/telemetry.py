@@ -0,0 +1,269 @@
+"""Batched gameplay telemetry ingestion.
+
+Clients post arrays of per-run events (optionally gzip-compressed); they are
+appended to a bounded in-memory buffer and a background task drains it into
+Mongo with ``insert_many``, so one flush replaces thousands of single inserts.
+When the buffer is full, ingestion is refused and the client is expected to
+retry later (backpressure) instead of the server growing without bound.
+
+A batch that fails to write is retried (transient errors) up to
+``max_attempts`` times and then dropped, so a single bad batch cannot stall
+the queue. Documents the database rejects individually (bulk write errors)
+are never retried; duplicate-key errors mean the document is already stored.
+"""
+import asyncio
+import json
+import logging
+import time
+import zlib
+from collections import deque
+from datetime import datetime
+from typing import AsyncIterator, List, Optional
+
+
+logger = logging.getLogger(__name__)
+
+EVENT_TYPES = {"death", "coin", "power_up", "checkpoint", "level_complete", "game_over"}
+MAX_EVENTS_PER_BATCH = 5000
+MAX_BODY_BYTES = 1024 * 1024
+MAX_DECODED_BYTES = 8 * 1024 * 1024
+DUPLICATE_KEY = 11000
+
+# zlib window bits per Content-Encoding
+_WBITS = {"gzip": 16 + zlib.MAX_WBITS, "deflate": zlib.MAX_WBITS}
+
+
+class TelemetryError(ValueError):
+    pass
+
+
+class PayloadTooLarge(TelemetryError):
+    pass
+
+
+async def read_body(chunks: AsyncIterator[bytes], content_length: Optional[str] = None,
+                    limit: int = MAX_BODY_BYTES) -> bytes:
+    """Read a request body, refusing anything larger than ``limit`` bytes."""
+    if content_length is not None and content_length.isdigit() and int(content_length) > limit:
+        raise PayloadTooLarge("Telemetry batch too large")
+    body = bytearray()
+    async for chunk in chunks:
+        body.extend(chunk)
+        if len(body) > limit:
+            raise PayloadTooLarge("Telemetry batch too large")
+    return bytes(body)
+
+
+def decode_payload(body: bytes, content_encoding: Optional[str] = None) -> dict:
+    """Decompress and parse a telemetry request body.
+
+    Decompression stops at ``MAX_DECODED_BYTES``, so a small compressed body
+    can't expand into an arbitrarily large one.
+    """
+    encoding = (content_encoding or "").lower()
+    if encoding in _WBITS:
+        decompressor = zlib.decompressobj(wbits=_WBITS[encoding])
+        try:
+            decoded = decompressor.decompress(body, MAX_DECODED_BYTES + 1)
+        except zlib.error as e:
+            raise TelemetryError(f"Invalid compressed body: {e}")
+        if len(decoded) > MAX_DECODED_BYTES or decompressor.unconsumed_tail:
+            raise PayloadTooLarge("Telemetry batch too large")
+        if not decompressor.eof:
+            raise TelemetryError("Truncated compressed body")
+        body = decoded
+    elif encoding not in ("", "identity"):
+        raise TelemetryError(f"Unsupported content encoding: {content_encoding}")
+    elif len(body) > MAX_DECODED_BYTES:
+        raise PayloadTooLarge("Telemetry batch too large")
+    try:
+        return json.loads(body)
+    except ValueError as e:
+        raise TelemetryError(f"Invalid JSON body: {e}")
+
+
+def _check_keys(value, depth: int = 0):
+    """Reject keys Mongo treats specially (``_id``, ``$op``, dotted paths)."""
+    if depth > 8:
+        raise TelemetryError("Event nested too deeply")
+    if isinstance(value, dict):
+        for key, item in value.items():
+            if not isinstance(key, str) or key.startswith("$") or "." in key or (depth == 0 and key == "_id"):
+                raise TelemetryError(f"Invalid event field: {key!r}"[:200])
+            _check_keys(item, depth + 1)
+    elif isinstance(value, list):
+        for item in value:
+            _check_keys(item, depth + 1)
+
+
+def build_documents(payload: dict) -> List[dict]:
+    """Validate a decoded batch and flatten it into Mongo documents.
+
+    Expected shape::
+
+        {"run_id": "...", "user_id": "...", "events": [{"type": "coin", "t": 1234, ...}, ...]}
+    """
+    if not isinstance(payload, dict):
+        raise TelemetryError("Telemetry batch must be an object")
+    run_id = payload.get("run_id")
+    user_id = payload.get("user_id")
+    events = payload.get("events")
+    if not isinstance(run_id, str) or not run_id:
+        raise TelemetryError("run_id is required")
+    if user_id is not None and not isinstance(user_id, str):
+        raise TelemetryError("user_id must be a string")
+    if not isinstance(events, list):
+        raise TelemetryError("events must be a list")
+    if len(events) > MAX_EVENTS_PER_BATCH:
+        raise TelemetryError(f"At most {MAX_EVENTS_PER_BATCH} events per batch")
+
+    received_at = datetime.utcnow()
+    documents = []
+    for event in events:
+        if not isinstance(event, dict) or event.get("type") not in EVENT_TYPES:
+            raise TelemetryError(f"Invalid event: {event!r}"[:200])
+        _check_keys(event)
+        documents.append({**event, "run_id": run_id, "user_id": user_id, "received_at": received_at})
+    return documents
+
+
+class TelemetryBuffer:
+    """Bounded event buffer drained into a Mongo collection by a background task.
+
+    Flushes happen when ``flush_size`` events are pending or ``flush_interval``
+    seconds have passed since the last flush, whichever comes first.
+    """
+
+    def __init__(self, collection, capacity: int = 100_000, flush_size: int = 2000, flush_interval: float = 1.0,
+                 max_attempts: int = 5):
+        self.collection = collection
+        self.capacity = capacity
+        self.flush_size = flush_size
+        self.flush_interval = flush_interval
+        self.max_attempts = max_attempts
+        self._events = deque()
+        # A batch that failed transiently, retried before anything else
+        self._retry: Optional[List[dict]] = None
+        self._attempts = 0
+        self._wakeup = asyncio.Event()
+        self._task: Optional[asyncio.Task] = None
+        self.accepted = 0
+        self.rejected = 0
+        self.flushed = 0
+        self.failed = 0
+        self.dropped = 0
+
+    def __len__(self):
+        return len(self._events) + len(self._retry or ())
+
+    def append(self, documents: List[dict]) -> bool:
+        """Queue a whole batch, or refuse it if it would overflow the buffer."""
+        if len(self) + len(documents) > self.capacity:
+            self.rejected += len(documents)
+            return False
+        self._events.extend(documents)
+        self.accepted += len(documents)
+        if len(self._events) >= self.flush_size:
+            self._wakeup.set()
+        return True
+
+    def _handle_bulk_error(self, batch: List[dict], error) -> int:
+        """Account for a partially applied insert_many. Returns documents stored."""
+        details = error.details or {}
+        write_errors = details.get("writeErrors", [])
+        duplicates = sum(1 for e in write_errors if e.get("code") == DUPLICATE_KEY)
+        rejected = len(write_errors) - duplicates
+        if rejected:
+            self.dropped += rejected
+            logger.error("Dropping %d telemetry events rejected by the database: %s",
+                         rejected, next(e.get("errmsg") for e in write_errors if e.get("code") != DUPLICATE_KEY))
+        if details.get("writeConcernErrors"):
+            logger.warning("Telemetry flush hit write concern errors: %s", details["writeConcernErrors"])
+        return len(batch) - rejected
+
+    async def flush(self) -> int:
+        """Write one batch of at most ``flush_size`` events. Returns how many were stored."""
+        from pymongo.errors import BulkWriteError
+
+        if self._retry is not None:
+            batch, self._retry = self._retry, None
+        else:
+            count = min(len(self._events), self.flush_size)
+            if not count:
+                return 0
+            batch = [self._events.popleft() for _ in range(count)]
+            self._attempts = 0
+
+        try:
+            await self.collection.insert_many(batch, ordered=False)
+        except BulkWriteError as e:
+            # Per-document errors are permanent; everything else was written
+            stored = self._handle_bulk_error(batch, e)
+        except Exception:
+            self.failed += len(batch)
+            self._attempts += 1
+            if self._attempts >= self.max_attempts:
+                self.dropped += len(batch)
+                logger.exception("Dropping %d telemetry events after %d attempts", len(batch), self._attempts)
+                return 0
+            # Retried as-is: insert_many has already assigned _ids, so rows
+            # that did get written come back as duplicates and are counted.
+            self._retry = batch
+            raise
+        except BaseException:
+            # Cancelled (shutdown): keep the batch for drain()
+            self._retry = batch
+            raise
+        else:
+            stored = len(batch)
+        self.flushed += stored
+        return stored
+
+    async def drain(self):
+        while len(self):
+            await self.flush()
+
+    async def _run(self):
+        while True:
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+            try:
+                while len(self) >= self.flush_size:
+                    await self.flush()
+                await self.flush()
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                logger.exception("Telemetry flush failed, retrying in %.1fs", self.flush_interval)
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        try:
+            await self.drain()
+        except Exception:
+            logger.exception("Dropping %d telemetry events on shutdown", len(self))
+
+    def stats(self) -> dict:
+        return {
+            "buffered": len(self),
+            "capacity": self.capacity,
+            "accepted": self.accepted,
+            "rejected": self.rejected,
+            "flushed": self.flushed,
+            "failed": self.failed,
+            "dropped": self.dropped,
+            "timestamp": time.time(),
+        }
@@ -0,0 +1,96 @@
+import asyncio
+from datetime import datetime, timedelta
+
+import pyarrow.parquet as pq
+from mongomock_motor import AsyncMongoMockClient
+
+from export import (
+    NULL_PARTITION,
+    documents_to_frame,
+    load_watermarks,
+    run_export,
+    save_watermarks,
+    write_batch,
+)
+
+
+def score(score_id, created_at, **fields):
+    return {"id": score_id, "user_id": "u1", "username": "mario", "score": 100, "level_reached": 2,
+            "coins_collected": 5, "game_duration": 60, "created_at": created_at, **fields}
+
+
+def read_rows(out_dir, collection):
+    rows = []
+    for path in sorted((out_dir / collection).glob("date=*/*.parquet")):
+        rows.extend(pq.read_table(path).to_pylist())
+    return sorted(rows, key=lambda row: row["id"])
+
+
+def test_documents_to_frame_keeps_missing_integers_null():
+    documents = [score("s1", datetime(2024, 5, 1)), score("s2", datetime(2024, 5, 1))]
+    del documents[1]["level_reached"]
+    frame = documents_to_frame("scores", documents)
+    assert frame["level_reached"].tolist()[0] == 2
+    assert frame["level_reached"].isna().tolist() == [False, True]
+
+
+def test_documents_to_frame_drops_unknown_fields():
+    frame = documents_to_frame("users", [{"id": "u1", "username": "mario", "password_hash": "x",
+                                          "created_at": datetime(2024, 5, 1)}])
+    assert "password_hash" not in frame.columns
+
+
+def test_write_batch_partitions_by_date(tmp_path):
+    documents = [
+        score("s1", datetime(2024, 5, 1, 10)),
+        score("s2", datetime(2024, 5, 1, 23)),
+        score("s3", datetime(2024, 5, 2, 1)),
+        score("s4", None),
+    ]
+    files, rows = write_batch("scores", documents_to_frame("scores", documents), tmp_path, "run", 0)
+    assert rows == 4
+    assert sorted(path.parent.name for path in files) == [
+        "date=2024-05-01", "date=2024-05-02", f"date={NULL_PARTITION}"
+    ]
+    assert [row["id"] for row in read_rows(tmp_path, "scores")] == ["s1", "s2", "s3", "s4"]
+
+
+def test_write_batch_arrow(tmp_path):
+    import pyarrow.feather as feather
+
+    frame = documents_to_frame("scores", [score("s1", datetime(2024, 5, 1))])
+    files, rows = write_batch("scores", frame, tmp_path, "run", 0, fmt="arrow")
+    assert rows == 1
+    assert files[0].suffix == ".arrow"
+    assert feather.read_table(files[0]).num_rows == 1
+
+
+def test_watermarks_round_trip(tmp_path):
+    assert load_watermarks(tmp_path) == {}
+    watermarks = {"scores": datetime(2024, 5, 1, 12, 30, 15, 250000)}
+    save_watermarks(tmp_path, watermarks)
+    assert load_watermarks(tmp_path) == watermarks
+
+
+def test_incremental_export(tmp_path):
+    now = datetime.utcnow()
+    old = now - timedelta(hours=2)
+
+    async def main():
+        db = AsyncMongoMockClient()["test"]
+        await db.scores.insert_many([score("s1", old), score("s2", old + timedelta(minutes=1)), score("s3", None)])
+        first = await run_export(db, tmp_path, collections=["scores"], incremental=True, lag=3600)
+        first_watermark = load_watermarks(tmp_path)["scores"]
+        # Stamped inside the first run's lag window, committed after it ran
+        await db.scores.insert_one(score("late", now - timedelta(minutes=30)))
+        # Inside the second run's lag window: left for a later run
+        await db.scores.insert_one(score("recent", datetime.utcnow()))
+        second = await run_export(db, tmp_path, collections=["scores"], incremental=True, lag=60)
+        return first, first_watermark, second
+
+    first, first_watermark, second = asyncio.run(main())
+    assert first[0]["rows"] == 3
+    assert now - timedelta(seconds=3601) < first_watermark <= now - timedelta(seconds=3600) + timedelta(seconds=5)
+    assert second[0]["rows"] == 1
+    assert load_watermarks(tmp_path)["scores"] > now - timedelta(seconds=61)
+    assert [row["id"] for row in read_rows(tmp_path, "scores")] == ["late", "s1", "s2", "s3"]
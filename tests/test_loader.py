@@ -0,0 +1,167 @@
+import asyncio
+
+from loader import BatchLoader, _request_cache
+
+
+class Users:
+    """In-memory get_many_by_id that records each call."""
+
+    def __init__(self, *user_ids, delay=0.0):
+        self.rows = {user_id: {"id": user_id, "name": user_id} for user_id in user_ids}
+        self.delay = delay
+        self.calls = []
+
+    async def get_many_by_id(self, user_ids):
+        self.calls.append(list(user_ids))
+        rows = [dict(self.rows[user_id]) for user_id in user_ids if user_id in self.rows]
+        await asyncio.sleep(self.delay)
+        return rows
+
+
+def test_same_tick_loads_share_one_fetch():
+    async def main():
+        users = Users("a", "b", "c")
+        loader = BatchLoader(users.get_many_by_id)
+        results = await asyncio.gather(*(loader.load(key) for key in ["a", "b", "c", "a", "b", "x"]))
+        return users, loader, results
+
+    users, loader, results = asyncio.run(main())
+    assert [r and r["id"] for r in results] == ["a", "b", "c", "a", "b", None]
+    assert len(users.calls) == 1
+    assert sorted(users.calls[0]) == ["a", "b", "c", "x"]
+    assert loader.stats()["batches"] == 1
+
+
+def test_batches_are_capped():
+    async def main():
+        users = Users(*map(str, range(10)))
+        loader = BatchLoader(users.get_many_by_id, max_batch_size=4)
+        await asyncio.gather(*(loader.load(str(i)) for i in range(10)))
+        return users
+
+    assert [len(call) for call in asyncio.run(main()).calls] == [4, 4, 2]
+
+
+def test_loads_join_in_flight_fetch():
+    async def main():
+        users = Users("a", delay=0.05)
+        loader = BatchLoader(users.get_many_by_id)
+        first = asyncio.create_task(loader.load("a"))
+        await asyncio.sleep(0.01)
+        # The first fetch is now in flight; a later tick reuses it
+        second = await loader.load("a")
+        return users, await first, second
+
+    users, first, second = asyncio.run(main())
+    assert first == second == {"id": "a", "name": "a"}
+    assert users.calls == [["a"]]
+
+
+def test_missing_keys_are_cached_for_negative_ttl():
+    async def main():
+        users = Users()
+        loader = BatchLoader(users.get_many_by_id, negative_ttl=0.05)
+        assert await loader.load("ghost") is None
+        assert await loader.load("ghost") is None
+        assert len(users.calls) == 1
+        await asyncio.sleep(0.06)
+        users.rows["ghost"] = {"id": "ghost"}
+        assert await loader.load("ghost") == {"id": "ghost"}
+        return users
+
+    assert len(asyncio.run(main()).calls) == 2
+
+
+def test_clear_forgets_missing_key():
+    async def main():
+        users = Users()
+        loader = BatchLoader(users.get_many_by_id, negative_ttl=60)
+        assert await loader.load("new") is None
+        users.rows["new"] = {"id": "new"}
+        loader.clear("new")
+        return await loader.load("new")
+
+    assert asyncio.run(main()) == {"id": "new"}
+
+
+def test_clear_detaches_in_flight_fetch():
+    async def main():
+        users = Users(delay=0.05)
+        loader = BatchLoader(users.get_many_by_id, negative_ttl=60)
+        stale = asyncio.create_task(loader.load("u"))
+        await asyncio.sleep(0.01)
+        # Written while the first fetch (which saw no row) is in flight
+        users.rows["u"] = {"id": "u"}
+        loader.clear("u")
+        fresh = await loader.load("u")
+        stale_result = await stale
+        # The stale miss must not be remembered once the old fetch lands
+        after = await loader.load("u")
+        return users, stale_result, fresh, after
+
+    users, stale_result, fresh, after = asyncio.run(main())
+    assert stale_result is None
+    assert fresh == after == {"id": "u"}
+    assert len(users.calls) == 3
+
+
+def test_request_scope_memoizes():
+    async def request(loader, key):
+        token = _request_cache.set({})
+        try:
+            return [await loader.load(key), await loader.load(key)]
+        finally:
+            _request_cache.reset(token)
+
+    async def main():
+        users = Users("a")
+        loader = BatchLoader(users.get_many_by_id)
+        await request(loader, "a")
+        await request(loader, "a")
+        return users
+
+    # Once per request, never across requests
+    assert len(asyncio.run(main()).calls) == 2
+
+
+def test_failed_fetch_reaches_every_waiter():
+    async def main():
+        async def broken(keys):
+            raise ConnectionError("down")
+
+        loader = BatchLoader(broken)
+        return await asyncio.gather(loader.load("a"), loader.load("a"), loader.load("b"), return_exceptions=True)
+
+    results = asyncio.run(main())
+    assert all(isinstance(result, ConnectionError) for result in results)
+
+
+def test_cancelled_fetch_releases_waiters():
+    async def main():
+        users = Users("a", delay=10)
+        loader = BatchLoader(users.get_many_by_id)
+        waiter = asyncio.create_task(loader.load("a"))
+        await asyncio.sleep(0.01)
+        assert len(loader._tasks) == 1
+        for task in list(loader._tasks):
+            task.cancel()
+        results = await asyncio.wait_for(asyncio.gather(waiter, return_exceptions=True), 1)
+        return loader, results
+
+    loader, results = asyncio.run(main())
+    assert isinstance(results[0], asyncio.CancelledError)
+    assert not loader._tasks
+    assert not loader._in_flight
+
+
+def test_cancelled_caller_does_not_cancel_shared_fetch():
+    async def main():
+        users = Users("a", delay=0.05)
+        loader = BatchLoader(users.get_many_by_id)
+        impatient = asyncio.create_task(loader.load("a"))
+        patient = asyncio.create_task(loader.load("a"))
+        await asyncio.sleep(0.01)
+        impatient.cancel()
+        return await patient
+
+    assert asyncio.run(main()) == {"id": "a", "name": "a"}
@@ -0,0 +1,128 @@
+import fastapi.routing
+import pytest
+from fastapi.testclient import TestClient
+
+from profiling import Profiler, RequestProfile
+
+ADMIN = {"X-Admin-Token": "secret"}
+
+
+def hand_built_profile():
+    profile = RequestProfile("GET", "/api/users/u1")
+    profile.route = "/api/users/{user_id}"
+    profile.wall_ms = 10.0
+    profile.cpu_ms = 5.0
+    profile.add("validation", 0.001, 0.001)
+    profile.add("handler", 0.006, 0.002)
+    profile.add("db:users.find_one", 0.002, 0.0005)
+    profile.add("db:users.find_one", 0.002, 0.0005)
+    profile.add("serialization", 0.0005, 0.0005)
+    return profile
+
+
+def test_breakdown_moves_db_time_out_of_handler():
+    phases = hand_built_profile().breakdown()
+    assert phases["handler"] == {"wall_ms": 2.0, "cpu_ms": 1.0, "calls": 1}
+    assert phases["db:users.find_one"] == {"wall_ms": 4.0, "cpu_ms": 1.0, "calls": 2}
+    # 10 ms total, 1 + 2 + 4 + 0.5 ms accounted for
+    assert phases["framework"]["wall_ms"] == 2.5
+    assert phases["framework"]["cpu_ms"] == 1.5
+    assert sum(phase["wall_ms"] for phase in phases.values()) == pytest.approx(10.0)
+
+
+def test_folded_output():
+    assert hand_built_profile().folded() == [
+        "GET /api/users/{user_id};validation 1000",
+        "GET /api/users/{user_id};handler 2000",
+        "GET /api/users/{user_id};handler;db:users.find_one 4000",
+        "GET /api/users/{user_id};serialization 500",
+        "GET /api/users/{user_id};framework 2500",
+    ]
+
+
+def test_configure_rejects_invalid_settings_atomically():
+    profiler = Profiler(buffer_size=10)
+    for invalid in [{"sample_rate": 1.5}, {"slow_ms": -1}, {"buffer_size": -1}]:
+        with pytest.raises(ValueError):
+            profiler.configure(enabled=True, route="/api/health", **invalid)
+    assert profiler.settings()["enabled"] is False
+    assert profiler.route is None
+    assert profiler.slow_requests.maxlen == 10
+
+
+def test_buffer_resize_keeps_newest():
+    profiler = Profiler(buffer_size=5)
+    profiler.configure(enabled=True, slow_ms=0)
+    for i in range(5):
+        profile = RequestProfile("GET", f"/{i}")
+        profiler.record(profile)
+    profiler.configure(buffer_size=2)
+    assert [profile.path for profile in profiler.slow_requests] == ["/3", "/4"]
+
+
+def test_route_filter():
+    profiler = Profiler()
+    profiler.configure(enabled=True, sample_rate=0.0, route="/api/users/{user_id}", slow_ms=0)
+    assert profiler.should_profile()
+    other = RequestProfile("GET", "/api/health")
+    other.route = "/api/health"
+    profiler.record(other)
+    profiler.record(hand_built_profile())
+    assert profiler.profiled == 1
+    assert [profile.route for profile in profiler.slow_requests] == ["/api/users/{user_id}"]
+    profiler.configure(enabled=False)
+    assert not profiler.should_profile()
+
+
+@pytest.fixture
+def client(tmp_path, monkeypatch):
+    monkeypatch.setenv("STORAGE_BACKEND", "sqlite")
+    monkeypatch.setenv("SQLITE_PATH", str(tmp_path / "test.db"))
+    monkeypatch.setenv("ADMIN_TOKEN", "secret")
+    import server
+
+    with TestClient(server.create_app()) as client:
+        yield client
+
+
+def test_importing_server_leaves_fastapi_unpatched():
+    import server  # noqa: F401
+
+    assert fastapi.routing.run_endpoint_function.__module__ == "fastapi.routing"
+    assert fastapi.routing.serialize_response.__module__ == "fastapi.routing"
+
+
+def test_profiled_request_phases(client):
+    user = client.post("/api/users", json={"username": "mario", "password": "x"}).json()
+    response = client.put("/api/admin/profiling", json={"enabled": True, "sample_rate": 1.0, "slow_ms": 0},
+                          headers=ADMIN)
+    assert response.status_code == 200
+    client.delete("/api/admin/profiling/slow", headers=ADMIN)
+
+    response = client.post("/api/scores", json={"user_id": user["id"], "username": "mario", "score": 10,
+                                                "level_reached": 1, "coins_collected": 2, "game_duration": 30})
+    assert response.status_code == 200
+
+    profiles = client.get("/api/admin/profiling/slow", headers=ADMIN).json()
+    score_profile = next(profile for profile in profiles if profile["route"] == "/api/scores")
+    assert score_profile["status"] == 200
+    assert {"validation", "handler", "serialization", "framework", "db:users.load", "db:scores.insert",
+            "db:users.update"} <= set(score_profile["phases"])
+
+    folded = client.get("/api/admin/profiling/slow?format=folded", headers=ADMIN).text
+    assert "POST /api/scores;handler;db:scores.insert " in folded
+
+
+def test_rejected_request_is_all_validation(client):
+    client.put("/api/admin/profiling", json={"enabled": True, "route": "/api/scores", "slow_ms": 0}, headers=ADMIN)
+    assert client.post("/api/scores", json={"user_id": "u1"}).status_code == 422
+    profile = client.get("/api/admin/profiling/slow", headers=ADMIN).json()[-1]
+    assert profile["status"] == 422
+    assert "validation" in profile["phases"]
+    assert "handler" not in profile["phases"]
+
+
+def test_invalid_settings_change_nothing(client):
+    response = client.put("/api/admin/profiling", json={"enabled": True, "buffer_size": -1}, headers=ADMIN)
+    assert response.status_code == 422
+    assert client.get("/api/admin/profiling", headers=ADMIN).json()["enabled"] is False
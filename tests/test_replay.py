@@ -0,0 +1,101 @@
+import random
+
+import pytest
+
+from replay import (
+    KEY_BITS,
+    MAGIC,
+    MAX_FRAMES,
+    ReplayCache,
+    ReplayFormatError,
+    decode_replay,
+    encode_replay,
+    frames_to_runs,
+    runs_to_frames,
+)
+
+
+def random_frames(count, seed=0):
+    rng = random.Random(seed)
+    masks = [0, KEY_BITS["ArrowRight"], KEY_BITS["ArrowRight"] | KEY_BITS["Space"],
+             KEY_BITS["ArrowLeft"] | KEY_BITS["ShiftLeft"], KEY_BITS["ShiftRight"] | KEY_BITS["ArrowUp"]]
+    frames = []
+    while len(frames) < count:
+        frames.extend([rng.choice(masks)] * rng.randint(1, 90))
+    return frames[:count]
+
+
+def test_key_bits_match_engine_codes():
+    assert set(KEY_BITS) == {"ArrowLeft", "ArrowRight", "ArrowUp", "Space", "ShiftLeft", "ShiftRight"}
+    bits = list(KEY_BITS.values())
+    assert len(set(bits)) == len(bits)
+    assert all(bit & (bit - 1) == 0 for bit in bits)
+
+
+def test_round_trip():
+    frames = random_frames(60 * 60)
+    data = encode_replay(frames_to_runs(frames), frame_rate=60)
+    assert data[:3] == MAGIC
+    decoded = decode_replay(data)
+    assert decoded["frame_rate"] == 60
+    assert decoded["frame_count"] == len(frames)
+    assert runs_to_frames(decoded["runs"]) == frames
+
+
+def test_round_trip_empty_and_long_runs():
+    assert decode_replay(encode_replay([]))["runs"] == []
+    runs = [(0, MAX_FRAMES - 1), (KEY_BITS["Space"], 1)]
+    assert decode_replay(encode_replay(runs))["runs"] == runs
+
+
+def test_adjacent_runs_are_merged():
+    decoded = decode_replay(encode_replay([(1, 2), (1, 3), (2, 1)]))
+    assert decoded["runs"] == [(1, 5), (2, 1)]
+
+
+@pytest.mark.parametrize("runs, frame_rate", [
+    ([(256, 1)], 60),
+    ([(1, 0)], 60),
+    ([(1, MAX_FRAMES + 1)], 60),
+    ([(1, 1)], 0),
+    ([(1, 1)], 256),
+])
+def test_encode_rejects_invalid_input(runs, frame_rate):
+    with pytest.raises(ReplayFormatError):
+        encode_replay(runs, frame_rate)
+
+
+def test_decode_rejects_every_truncation():
+    data = encode_replay(frames_to_runs(random_frames(5000)))
+    for end in range(len(data)):
+        with pytest.raises(ReplayFormatError):
+            decode_replay(data[:end])
+
+
+@pytest.mark.parametrize("data", [
+    b"",
+    b"XYZ\x01\x3c\x00\x00",
+    b"RPL\x02\x3c\x00\x00",  # unknown version
+    b"RPL\x01\x3c\x05\x01\x01\x04",  # frame count mismatch
+    b"RPL\x01\x3c\x01\x01\x01\x01\x00",  # trailing bytes
+    b"RPL\x01\x3c\x00\x01\x01\x00",  # zero-length run
+    b"RPL\x01\x3c\x01\x01\xff\x01",  # unknown key bits
+    b"RPL\x01\x3c" + b"\xff" * 12,  # varint too long
+])
+def test_decode_rejects_malformed(data):
+    with pytest.raises(ReplayFormatError):
+        decode_replay(data)
+
+
+def test_cache_evicts_least_recently_used():
+    cache = ReplayCache(maxsize=2)
+    cache.put("a", {"id": "a"})
+    cache.put("b", {"id": "b"})
+    assert cache.get("a") == {"id": "a"}
+    cache.put("c", {"id": "c"})
+    assert cache.get("b") is None
+    assert cache.get("a") is not None
+    assert cache.get("c") is not None
+    cache.invalidate("a")
+    assert cache.get("a") is None
+    assert (cache.hits, cache.misses) == (3, 2)
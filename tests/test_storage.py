@@ -0,0 +1,192 @@
+"""The SQLite repositories must answer like the Mongo ones for the same calls."""
+import asyncio
+from datetime import datetime, timedelta
+
+import pytest
+from mongomock_motor import AsyncMongoMockClient
+
+from replay import encode_replay
+from storage import MongoStorage
+from storage_sqlite import SQLiteStorage
+
+
+CREATED = datetime(2024, 5, 1, 12, 0, 0)
+
+
+def user(user_id, username, high_score=0):
+    return {"id": user_id, "username": username, "email": f"{username}@example.com", "password_hash": "x",
+            "created_at": CREATED, "high_score": high_score, "total_coins": 0, "levels_completed": 0}
+
+
+def score(score_id, user_id, points, minutes=0):
+    return {"id": score_id, "user_id": user_id, "username": user_id, "score": points, "level_reached": 1,
+            "coins_collected": 3, "game_duration": 60, "created_at": CREATED + timedelta(minutes=minutes)}
+
+
+def progress(user_id, level):
+    return {"id": f"p-{user_id}", "user_id": user_id, "current_level": level, "lives_remaining": 3, "score": 100,
+            "coins": 2, "power_ups": ["mushroom"], "last_checkpoint": {"x": 10, "y": 20}, "updated_at": CREATED}
+
+
+def clean(value):
+    """Drop Mongo's ``_id`` so documents compare across backends."""
+    if isinstance(value, list):
+        return [clean(item) for item in value]
+    if isinstance(value, dict):
+        return {key: clean(item) for key, item in value.items() if key != "_id"}
+    return value
+
+
+def run_on_both(scenario, tmp_path):
+    """Run ``scenario(storage)`` against each backend, returning both results."""
+    async def run(storage):
+        try:
+            return clean(await scenario(storage))
+        finally:
+            await storage.close()
+
+    client = AsyncMongoMockClient()
+    mongo = asyncio.run(run(MongoStorage(client, client["test"])))
+    sqlite = asyncio.run(run(SQLiteStorage(tmp_path / "test.db")))
+    return mongo, sqlite
+
+
+def test_users(tmp_path):
+    async def scenario(storage):
+        await storage.users.insert(user("u1", "mario"))
+        await storage.users.insert(user("u2", "luigi"))
+        await storage.users.update("u1", {"high_score": 500, "total_coins": 7})
+        many = await storage.users.get_many_by_id(["u1", "u2", "missing"])
+        return {
+            "by_id": await storage.users.get_by_id("u1"),
+            "by_name": await storage.users.get_by_username("luigi"),
+            "unknown": await storage.users.get_by_id("missing"),
+            "many": sorted(many, key=lambda doc: doc["id"]),
+            "count": await storage.users.count(),
+        }
+
+    mongo, sqlite = run_on_both(scenario, tmp_path)
+    assert mongo == sqlite
+    assert sqlite["by_id"]["high_score"] == 500
+    assert sqlite["by_id"]["created_at"] == CREATED
+    assert [doc["id"] for doc in sqlite["many"]] == ["u1", "u2"]
+    assert sqlite["unknown"] is None
+    assert sqlite["count"] == 2
+
+
+def test_scores(tmp_path):
+    async def scenario(storage):
+        for i, (user_id, points) in enumerate([("u1", 300), ("u2", 900), ("u1", 100), ("u1", 500)]):
+            await storage.scores.insert(score(f"s{i}", user_id, points, minutes=i))
+        return {
+            "get": await storage.scores.get("s1"),
+            "top": await storage.scores.top(3),
+            "for_user": await storage.scores.for_user("u1", 2),
+            "highest": await storage.scores.highest(),
+            "most_active": await storage.scores.most_active(1),
+            "count": await storage.scores.count(),
+        }
+
+    mongo, sqlite = run_on_both(scenario, tmp_path)
+    assert mongo == sqlite
+    assert [doc["score"] for doc in sqlite["top"]] == [900, 500, 300]
+    assert [doc["score"] for doc in sqlite["for_user"]] == [500, 300]
+    assert sqlite["highest"]["id"] == "s1"
+    assert sqlite["most_active"] == [{"user_id": "u1", "games_played": 3}]
+
+
+def test_empty_scores(tmp_path):
+    async def scenario(storage):
+        return [await storage.scores.top(10), await storage.scores.highest(), await storage.scores.most_active(1),
+                await storage.scores.count()]
+
+    mongo, sqlite = run_on_both(scenario, tmp_path)
+    assert mongo == sqlite == [[], None, [], 0]
+
+
+def test_progress(tmp_path):
+    async def scenario(storage):
+        await storage.game_progress.insert(progress("u1", 1))
+        await storage.game_progress.update("u1", {"current_level": 4, "power_ups": ["star", "flower"]})
+        updated = await storage.game_progress.get("u1")
+        deleted = await storage.game_progress.delete("u1")
+        return [updated, deleted, await storage.game_progress.get("u1"), await storage.game_progress.delete("u1")]
+
+    mongo, sqlite = run_on_both(scenario, tmp_path)
+    assert mongo == sqlite
+    updated, deleted, after, deleted_again = sqlite
+    assert updated["current_level"] == 4
+    assert updated["power_ups"] == ["star", "flower"]
+    assert updated["last_checkpoint"] == {"x": 10, "y": 20}
+    assert (deleted, after, deleted_again) == (True, None, False)
+
+
+def test_replays(tmp_path):
+    def replay(score_id, runs):
+        data = encode_replay(runs)
+        return {"id": f"r-{score_id}", "score_id": score_id, "user_id": "u1", "frame_rate": 60,
+                "frame_count": sum(length for _, length in runs), "size_bytes": len(data), "created_at": CREATED,
+                "data": data}
+
+    async def scenario(storage):
+        await storage.replays.save(replay("s1", [(1, 10)]))
+        await storage.replays.save(replay("s2", [(2, 5)]))
+        # A second upload for the same score replaces the first
+        await storage.replays.save(replay("s1", [(4, 30)]))
+        many = await storage.replays.get_many(["s1", "s2", "s3"])
+        return [await storage.replays.get("s1"), sorted(many, key=lambda doc: doc["score_id"]),
+                await storage.replays.get("s3")]
+
+    mongo, sqlite = run_on_both(scenario, tmp_path)
+    assert mongo == sqlite
+    single, many, missing = sqlite
+    assert single["frame_count"] == 30
+    assert bytes(single["data"]) == encode_replay([(4, 30)])
+    assert [doc["score_id"] for doc in many] == ["s1", "s2"]
+    assert missing is None
+
+
+def test_sessions_and_events(tmp_path):
+    async def scenario(storage):
+        await storage.game_sessions.insert({"id": "g1", "user_id": "u1", "session_token": "t", "created_at": CREATED,
+                                            "expires_at": CREATED + timedelta(days=1), "is_active": True})
+        await storage.game_events.insert_many([
+            {"run_id": "r1", "user_id": "u1", "type": "coin", "t": 5, "received_at": CREATED},
+            {"run_id": "r1", "user_id": None, "type": "death", "received_at": CREATED},
+        ], ordered=False)
+
+    run_on_both(scenario, tmp_path)
+
+    async def read_back():
+        storage = SQLiteStorage(tmp_path / "test.db")
+        try:
+            return await storage.database.fetchall("SELECT run_id, type, payload FROM game_events ORDER BY seq")
+        finally:
+            await storage.close()
+
+    assert asyncio.run(read_back()) == [
+        {"run_id": "r1", "type": "coin", "payload": {"t": 5}},
+        {"run_id": "r1", "type": "death", "payload": {}},
+    ]
+
+
+@pytest.mark.parametrize("fields", [{"password": "x"}, {"id = id; --": 1}])
+def test_sqlite_update_rejects_unknown_columns(tmp_path, fields):
+    async def main():
+        storage = SQLiteStorage(tmp_path / "test.db")
+        try:
+            await storage.users.insert(user("u1", "mario"))
+            await storage.users.update("u1", fields)
+        finally:
+            await storage.close()
+
+    with pytest.raises(ValueError):
+        asyncio.run(main())
+
+
+def test_sqlite_backend_leaves_sqlite3_defaults_alone():
+    import sqlite3
+
+    assert not {"DATETIME", "JSON", "BOOLEAN"} & set(sqlite3.converters)
+    # Still the standard library's own default adapter
+    assert sqlite3.adapters[(datetime, sqlite3.PrepareProtocol)].__module__ == "sqlite3.dbapi2"
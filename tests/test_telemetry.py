@@ -0,0 +1,205 @@
+import asyncio
+import gzip
+import json
+
+import pytest
+from mongomock_motor import AsyncMongoMockClient
+from pymongo.errors import BulkWriteError
+
+from telemetry import (
+    MAX_DECODED_BYTES,
+    PayloadTooLarge,
+    TelemetryBuffer,
+    TelemetryError,
+    build_documents,
+    decode_payload,
+    read_body,
+)
+
+
+def events(count, run_id="run-1"):
+    return build_documents({"run_id": run_id, "events": [{"type": "coin", "t": i} for i in range(count)]})
+
+
+async def chunks(*parts):
+    for part in parts:
+        yield part
+
+
+class FailingCollection:
+    """Raises ``error`` on the first ``failures`` writes, then stores normally."""
+
+    def __init__(self, error, failures=1):
+        self.error = error
+        self.failures = failures
+        self.documents = []
+
+    async def insert_many(self, documents, ordered=True):
+        if self.failures:
+            self.failures -= 1
+            raise self.error
+        self.documents.extend(documents)
+
+
+def test_build_documents_flattens_batch():
+    documents = build_documents({"run_id": "r", "user_id": "u", "events": [{"type": "death", "x": 3}]})
+    assert len(documents) == 1
+    assert documents[0]["type"] == "death"
+    assert documents[0]["run_id"] == "r"
+    assert documents[0]["user_id"] == "u"
+    assert "received_at" in documents[0]
+
+
+@pytest.mark.parametrize("event", [
+    {"type": "coin", "_id": 1},
+    {"type": "coin", "$set": {"x": 1}},
+    {"type": "coin", "a.b": 1},
+    {"type": "coin", "nested": {"$where": "1"}},
+    {"type": "unknown"},
+])
+def test_build_documents_rejects_bad_events(event):
+    with pytest.raises(TelemetryError):
+        build_documents({"run_id": "r", "events": [event]})
+
+
+def test_decode_payload_gzip_round_trip():
+    payload = {"run_id": "r", "events": [{"type": "coin"}]}
+    assert decode_payload(gzip.compress(json.dumps(payload).encode()), "gzip") == payload
+
+
+def test_decode_payload_rejects_decompression_bomb():
+    bomb = gzip.compress(b" " * (MAX_DECODED_BYTES + 1024))
+    assert len(bomb) < 64 * 1024
+    with pytest.raises(PayloadTooLarge):
+        decode_payload(bomb, "gzip")
+
+
+def test_decode_payload_rejects_truncated_body():
+    body = gzip.compress(json.dumps({"run_id": "r", "events": []}).encode())
+    with pytest.raises(TelemetryError):
+        decode_payload(body[:-10], "gzip")
+
+
+def test_read_body_limits():
+    assert asyncio.run(read_body(chunks(b"ab", b"cd"), "4", limit=4)) == b"abcd"
+    with pytest.raises(PayloadTooLarge):
+        asyncio.run(read_body(chunks(b"abcd"), "5", limit=4))
+    # A lying Content-Length doesn't get past the running count
+    with pytest.raises(PayloadTooLarge):
+        asyncio.run(read_body(chunks(b"abc", b"de"), "2", limit=4))
+
+
+def test_append_refuses_batches_over_capacity():
+    buffer = TelemetryBuffer(None, capacity=10, flush_size=100)
+    assert buffer.append(events(8))
+    assert not buffer.append(events(3))
+    assert len(buffer) == 8
+    assert buffer.accepted == 8
+    assert buffer.rejected == 3
+
+
+def test_flush_writes_in_batches():
+    async def main():
+        collection = AsyncMongoMockClient()["test"]["game_events"]
+        buffer = TelemetryBuffer(collection, flush_size=4)
+        buffer.append(events(10))
+        assert await buffer.flush() == 4
+        await buffer.drain()
+        return buffer, await collection.count_documents({})
+
+    buffer, stored = asyncio.run(main())
+    assert stored == 10
+    assert buffer.flushed == 10
+    assert len(buffer) == 0
+
+
+def test_transient_failure_is_retried():
+    async def main():
+        collection = FailingCollection(ConnectionError("reset"), failures=2)
+        buffer = TelemetryBuffer(collection, flush_size=5, max_attempts=5)
+        buffer.append(events(5))
+        for _ in range(2):
+            with pytest.raises(ConnectionError):
+                await buffer.flush()
+            assert len(buffer) == 5
+        assert await buffer.flush() == 5
+        return buffer, collection
+
+    buffer, collection = asyncio.run(main())
+    assert len(collection.documents) == 5
+    assert buffer.failed == 10
+    assert buffer.flushed == 5
+    assert buffer.dropped == 0
+
+
+def test_batch_dropped_after_max_attempts():
+    async def main():
+        collection = FailingCollection(ConnectionError("reset"), failures=100)
+        buffer = TelemetryBuffer(collection, flush_size=5, max_attempts=3)
+        buffer.append(events(5))
+        buffer.append(events(2, run_id="run-2"))
+        for _ in range(2):
+            with pytest.raises(ConnectionError):
+                await buffer.flush()
+        assert await buffer.flush() == 0
+        # The queue moves on to the next batch
+        collection.failures = 0
+        assert await buffer.flush() == 2
+        return buffer, collection
+
+    buffer, collection = asyncio.run(main())
+    assert buffer.dropped == 5
+    assert [doc["run_id"] for doc in collection.documents] == ["run-2", "run-2"]
+
+
+def test_duplicates_count_as_written():
+    async def main():
+        collection = AsyncMongoMockClient()["test"]["game_events"]
+        documents = events(3)
+        await collection.insert_many(documents)
+        # Same documents (and _ids) again, like a retry after a lost reply
+        buffer = TelemetryBuffer(collection)
+        buffer.append(documents)
+        assert await buffer.flush() == 3
+        return buffer, await collection.count_documents({})
+
+    buffer, stored = asyncio.run(main())
+    assert stored == 3
+    assert buffer.flushed == 3
+    assert buffer.dropped == 0
+    assert len(buffer) == 0
+
+
+def test_poison_documents_are_dropped_not_retried():
+    error = BulkWriteError({"writeErrors": [
+        {"index": 0, "code": 2, "errmsg": "bad document"},
+        {"index": 1, "code": 11000, "errmsg": "E11000 duplicate key"},
+    ]})
+
+    async def main():
+        collection = FailingCollection(error, failures=1)
+        buffer = TelemetryBuffer(collection)
+        buffer.append(events(4))
+        assert await buffer.flush() == 3
+        assert await buffer.flush() == 0
+        return buffer, collection
+
+    buffer, collection = asyncio.run(main())
+    assert buffer.dropped == 1
+    assert buffer.flushed == 3
+    assert collection.documents == []
+    assert len(buffer) == 0
+
+
+def test_stop_drains_buffer():
+    async def main():
+        collection = AsyncMongoMockClient()["test"]["game_events"]
+        buffer = TelemetryBuffer(collection, flush_size=1000, flush_interval=60)
+        buffer.start()
+        buffer.append(events(7))
+        await buffer.stop()
+        return buffer, await collection.count_documents({})
+
+    buffer, stored = asyncio.run(main())
+    assert stored == 7
+    assert len(buffer) == 0